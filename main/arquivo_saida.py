@@ -0,0 +1,157 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import tarfile
+import time
+import uuid
+import zipfile
+from pathlib import Path
+
+# --- Configuração de Logging ---
+logger = logging.getLogger(__name__)
+
+FORMATOS_ARQUIVO = ('zip', 'tar')
+FSYNC_A_CADA_BYTES = 64 * 2**20 # fsync em lote: um por ~64 MB gravados, não um por PDF
+
+def _fsync_pasta(pasta: Path):
+    """Garante que o rename do volume sobreviva a uma queda (só POSIX; no Windows é no-op)."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(pasta, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class GravadorArquivo:
+    """
+    Grava os PDFs prontos direto num arquivo ZIP ou tar, em vez de milhares de PDFs soltos.
+    - Cada volume é escrito como '<nome>.zip.part' e só ganha o nome final (rename atômico)
+      depois de fechado e sincronizado: um volume com nome final está sempre completo.
+    - Com 'volume_max_bytes', o lote é dividido em volumes ('<nome>-0001.zip', ...).
+    - Ao fechar, grava '<nome>-indice.json': pedido -> volume, membro, tamanho e SHA-256.
+      Pedidos idênticos são renderizados uma vez e gravados com cada nome de saída
+      (no tar, como hard link: os bytes entram uma vez só).
+    Não é thread-safe: no motor, só a etapa 'gravar' (1 trabalhador) usa o gravador.
+    """
+
+    def __init__(self, output_dir: Path, nome: str = "lote", formato: str = "zip", volume_max_bytes: int | None = None):
+        if formato not in FORMATOS_ARQUIVO:
+            raise ValueError(f"Formato de arquivo '{formato}' inválido. Use um de: {', '.join(FORMATOS_ARQUIVO)}.")
+        self.output_dir = Path(output_dir)
+        self.nome = nome
+        self.formato = formato
+        self.volume_max_bytes = volume_max_bytes
+        self.indice = {}
+        self.volumes = []
+        self._arquivo = None # ZipFile/TarFile do volume aberto
+        self._fp = None
+        self._part_path = None
+        self._final_path = None
+        self._membros_volume = 0
+        self._desde_fsync = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    # --- Volumes ---
+    def _nome_volume(self) -> str:
+        if self.volume_max_bytes is None:
+            return f"{self.nome}.{self.formato}"
+        return f"{self.nome}-{len(self.volumes) + 1:04d}.{self.formato}"
+
+    def _abrir_volume(self):
+        self._final_path = self.output_dir / self._nome_volume()
+        # .part com sufixo único: um shard retomado (modo distribuído) pode gravar o mesmo volume
+        self._part_path = self._final_path.with_name(f"{self._final_path.name}.{uuid.uuid4().hex[:8]}.part")
+        self._fp = open(self._part_path, 'wb')
+        if self.formato == 'zip':
+            # PDFs já vêm comprimidos (JPEG): ZIP_STORED evita gastar CPU à toa
+            self._arquivo = zipfile.ZipFile(self._fp, 'w', compression=zipfile.ZIP_STORED)
+        else:
+            self._arquivo = tarfile.open(fileobj=self._fp, mode='w', format=tarfile.PAX_FORMAT)
+        self._membros_volume = 0
+
+    def _fechar_volume(self):
+        self._arquivo.close() # Escreve o diretório central (ZIP) ou os blocos finais (tar)
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+        tamanho = self._fp.tell()
+        self._fp.close()
+        os.replace(self._part_path, self._final_path)
+        _fsync_pasta(self.output_dir)
+        self.volumes.append({'arquivo': self._final_path.name, 'membros': self._membros_volume, 'bytes': tamanho})
+        logger.info(f"Volume '{self._final_path.name}' fechado ({self._membros_volume} PDFs, {tamanho / 2**20:.1f} MB).")
+        self._arquivo = self._fp = None
+        self._desde_fsync = 0
+
+    # --- API ---
+    def _gravar_membro(self, membro: str, dados: bytes, original: str | None = None):
+        """Grava um membro; com 'original' (só tar), grava um hard link para ele em vez dos bytes."""
+        if self.formato == 'zip':
+            info = zipfile.ZipInfo(membro, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            self._arquivo.writestr(info, dados)
+            return
+        info = tarfile.TarInfo(membro)
+        info.mtime = int(time.time())
+        if original is None:
+            info.size = len(dados)
+            self._arquivo.addfile(info, io.BytesIO(dados))
+        else:
+            info.type = tarfile.LNKTYPE
+            info.linkname = original
+            self._arquivo.addfile(info)
+
+    def adicionar(self, membro: str, dados: bytes, pedidos: list[str] | None = None) -> str:
+        """
+        Acrescenta um PDF ao volume atual (abrindo um novo se passar do limite).
+        'pedidos' são os nomes de saída deste PDF (padrão: o próprio membro); cada um
+        vira um membro do arquivo, no mesmo volume: no tar, os extras são hard links
+        (LNKTYPE) para o primeiro; no ZIP, que não tem links, os bytes são repetidos.
+        Retorna 'volume:membro'.
+        """
+        nomes = list(dict.fromkeys([membro] + list(pedidos or [])))
+        copias = len(nomes) if self.formato == 'zip' else 1
+        if self._arquivo is not None and self.volume_max_bytes is not None and self._membros_volume \
+                and self._fp.tell() + len(dados) * copias > self.volume_max_bytes:
+            self._fechar_volume()
+        if self._arquivo is None:
+            self._abrir_volume()
+
+        sha256 = hashlib.sha256(dados).hexdigest()
+        for nome in nomes:
+            original = membro if nome != membro and self.formato == 'tar' else None
+            self._gravar_membro(nome, dados, original)
+            self._membros_volume += 1
+            entrada = {'arquivo': self._final_path.name, 'membro': nome, 'bytes': len(dados), 'sha256': sha256}
+            if original is not None:
+                entrada['link_para'] = original
+            self.indice[nome] = entrada
+
+        self._desde_fsync += len(dados) * copias
+        if self._desde_fsync >= FSYNC_A_CADA_BYTES:
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+            self._desde_fsync = 0
+        return f"{self._final_path.name}:{membro}"
+
+    def fechar(self) -> Path | None:
+        """Fecha o volume aberto e grava o índice (atômico). Retorna o caminho do índice."""
+        if self._arquivo is not None:
+            self._fechar_volume()
+        if not self.indice:
+            return None
+        indice_path = self.output_dir / f"{self.nome}-indice.json"
+        tmp_path = indice_path.with_name(f"{indice_path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'formato': self.formato, 'volumes': self.volumes, 'pedidos': self.indice}, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, indice_path)
+        return indice_path
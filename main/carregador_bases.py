@@ -0,0 +1,354 @@
+import ctypes
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor
+from multiprocessing import shared_memory
+from pathlib import Path
+import numpy as np
+from PIL import Image
+import fitz # PyMuPDF
+
+# --- Configuração de Logging ---
+logger = logging.getLogger(__name__)
+
+EXTENSOES_PDF = ('.pdf',)
+EXTENSOES_RASTER = ('.jpg', '.jpeg', '.png')
+EXTENSOES_BASE = EXTENSOES_PDF + EXTENSOES_RASTER
+BASE_CACHE_MAX = 4 # Páginas decodificadas mantidas em memória entre pedidos
+LIMITE_CACHE_PADRAO = 2**30 # Bytes do cache sem --memoria-mb (uma página de 16k x 10k px já tem ~660 MB)
+FAIXA_ALTURA_PX = 1024 # Altura de cada faixa ao rasterizar páginas grandes
+LIMITE_FAIXAS_BYTES = 64 * 2**20 # Páginas acima disso (em RGB) são rasterizadas em faixas
+BYTES_POR_PIXEL = 4 # O PIL guarda RGB com 4 bytes por pixel (RGBX) na memória
+DPI_PADRAO = 300 # Imagens sem DPI gravado são tratadas como 300 DPI
+
+def eh_raster(nome: str | Path) -> bool:
+    return Path(nome).suffix.lower() in EXTENSOES_RASTER
+
+def dpi_da_imagem(img: Image.Image) -> float:
+    """DPI horizontal da página decodificada (PDFs: o da rasterização; imagens: o do arquivo)."""
+    dpi = img.info.get('dpi')
+    return float(dpi[0]) if dpi and dpi[0] else float(DPI_PADRAO)
+
+def reamostrar_para_dpi(img: Image.Image, dpi: float) -> Image.Image:
+    """
+    Reamostra a página para 'dpi' mantendo o tamanho físico. O PDF do PIL usa uma
+    resolução só para todas as páginas: um verso com outro DPI sairia do tamanho errado.
+    Devolve a própria imagem se o DPI já bate (não copia).
+    """
+    escala = dpi / dpi_da_imagem(img)
+    if abs(escala - 1) < 1e-3:
+        return img
+    nova = img.resize((max(1, round(img.width * escala)), max(1, round(img.height * escala))), Image.Resampling.LANCZOS)
+    nova.info['dpi'] = (dpi, dpi)
+    return nova
+
+def _escala_para_caber(largura: float, altura: float, tamanho_max: tuple[int, int] | None) -> float:
+    if not tamanho_max:
+        return 1.0
+    return min(1.0, tamanho_max[0] / largura, tamanho_max[1] / altura)
+
+def _abrir_pagina(doc: fitz.Document, page_number: int, dpi: int, tamanho_max: tuple[int, int] | None) -> tuple[fitz.Page, fitz.Matrix, fitz.IRect]:
+    """Página + matriz de escala + área em pixels (já reduzida para caber em 'tamanho_max')."""
+    if page_number >= len(doc):
+        raise IndexError(f"PDF tem apenas {len(doc)} páginas. Não foi possível extrair a página {page_number + 1}.")
+    page: fitz.Page = doc[page_number]
+    zoom = dpi / 72
+    zoom *= _escala_para_caber(page.rect.width * zoom, page.rect.height * zoom, tamanho_max)
+    mat = fitz.Matrix(zoom, zoom)
+    return page, mat, (page.rect * mat).irect
+
+def _pixmaps_da_pagina(page: fitz.Page, mat: fitz.Matrix, area: fitz.IRect):
+    """
+    Gera os pixmaps RGB da página: ela inteira, se for pequena, ou faixas horizontais.
+    Em faixas, o pico de memória fica em ~1 página + 1 faixa, em vez de pixmap + bytes
+    + imagem (3 cópias da página inteira). A lista de exibição é montada uma vez só.
+    """
+    if area.width * area.height * BYTES_POR_PIXEL <= LIMITE_FAIXAS_BYTES:
+        yield page.get_pixmap(matrix=mat, alpha=False) # alpha=False para RGB
+        return
+    lista = page.get_displaylist()
+    try:
+        escala_y = mat.d # Pontos -> pixels no eixo Y
+        for linha in range(0, area.height, FAIXA_ALTURA_PX):
+            fim = min(linha + FAIXA_ALTURA_PX, area.height)
+            clip = fitz.Rect(page.rect.x0, (area.y0 + linha) / escala_y, page.rect.x1, (area.y0 + fim) / escala_y)
+            yield lista.get_pixmap(matrix=mat, clip=clip, alpha=False)
+    finally:
+        del lista
+        fitz.TOOLS.store_shrink(100) # Esvazia o cache interno do MuPDF (imagens embutidas já decodificadas)
+
+def _carregar_pagina_pdf(pdf_path: Path, page_number: int, dpi: int, tamanho_max: tuple[int, int] | None, dados: bytes | None = None) -> Image.Image:
+    doc = fitz.open(stream=dados, filetype="pdf") if dados is not None else fitz.open(pdf_path)
+    try:
+        page, mat, area = _abrir_pagina(doc, page_number, dpi, tamanho_max)
+        # Direto dos pixmaps para uma imagem PIL pré-alocada (sem PNG temporário em disco)
+        img = Image.new("RGB", (area.width, area.height))
+        for pix in _pixmaps_da_pagina(page, mat, area):
+            img.paste(Image.frombytes("RGB", (pix.width, pix.height), pix.samples), (pix.x - area.x0, pix.y - area.y0))
+            del pix # Libera o pixmap já (em páginas grandes são centenas de MB)
+        img.info['dpi'] = (mat.a * 72, mat.d * 72)
+        return img
+    finally:
+        doc.close()
+
+def _para_rgb(img: Image.Image) -> Image.Image:
+    """
+    Converte para RGB. Partes transparentes (PNG com alpha ou paleta com transparência)
+    são compostas sobre branco, como o papel: convert("RGB") só descartaria o alpha e
+    deixaria preto (ou a cor que estiver por baixo) no lugar.
+    """
+    if img.mode == "RGB":
+        return img
+    if img.mode in ("RGBA", "LA", "PA", "RGBa", "La") or 'transparency' in img.info:
+        camada = img.convert("RGBA")
+        fundo = Image.new("RGBA", camada.size, (255, 255, 255, 255))
+        return Image.alpha_composite(fundo, camada).convert("RGB")
+    return img.convert("RGB")
+
+def _carregar_imagem_raster(img_path: Path, tamanho_max: tuple[int, int] | None, dados: bytes | None = None) -> Image.Image:
+    img = Image.open(io.BytesIO(dados) if dados is not None else img_path)
+    dpi = img.info.get('dpi')
+    if tamanho_max:
+        # Em JPEG, o draft faz o decoder reduzir a escala (1/2, 1/4, 1/8) durante a
+        # decodificação, em vez de decodificar tudo e só depois encolher
+        img.draft("RGB", tamanho_max)
+    img = _para_rgb(img)
+    if tamanho_max and (img.width > tamanho_max[0] or img.height > tamanho_max[1]):
+        img.thumbnail(tamanho_max, Image.Resampling.LANCZOS)
+    img.load()
+    if dpi:
+        img.info['dpi'] = dpi # A composição sobre o branco gera uma imagem nova, sem o info
+    return img
+
+def carregar_pagina(path: Path, page_number: int = 0, dpi: int = 300, tamanho_max: tuple[int, int] | None = None, dados: bytes | None = None) -> Image.Image:
+    """
+    Decodifica uma página de base (PDF ou imagem) como PIL.Image RGB.
+    page_number é 0-based e só se aplica a PDFs; 'dpi' só vale para PDFs
+    (imagens usam seus próprios pixels). Com 'tamanho_max', a página já é
+    decodificada reduzida para caber nesse tamanho (usado nas prévias).
+    Se 'dados' vier preenchido (arquivo já lido), decodifica da memória.
+    """
+    if eh_raster(path):
+        if page_number != 0:
+            raise IndexError(f"Imagem '{path.name}' tem apenas 1 página.")
+        return _carregar_imagem_raster(path, tamanho_max, dados)
+    return _carregar_pagina_pdf(path, page_number, dpi, tamanho_max, dados)
+
+# --- Rasterização em Outros Processos ---
+# O MuPDF não pode ser usado por várias threads ao mesmo tempo (o PyMuPDF se
+# inicializa em modo single-thread). Para rasterizar em paralelo, cada página é
+# decodificada num processo separado e só os pixels voltam, por memória compartilhada.
+try:
+    _LIBC = ctypes.CDLL("libc.so.6")
+except OSError: # Não é glibc (Windows/macOS): malloc_trim não existe
+    _LIBC = None
+
+def devolver_memoria_ao_sistema():
+    """
+    Pede à glibc que devolva ao sistema a memória livre das arenas. Sem isso, os
+    blocos de uma página grande já liberada continuam contando no RSS do processo
+    (e no limite do OOM killer) até serem reaproveitados.
+    """
+    if _LIBC is not None and hasattr(_LIBC, "malloc_trim"):
+        _LIBC.malloc_trim(0)
+
+def _colar_pixmap(destino: np.ndarray, pix: fitz.Pixmap, area: fitz.IRect):
+    x, y = pix.x - area.x0, pix.y - area.y0
+    origem = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, 3)
+    # Arredondamento do clip pode passar um pixel da borda: recorta ao que cabe
+    altura = min(pix.height, destino.shape[0] - y)
+    largura = min(pix.width, destino.shape[1] - x)
+    destino[y:y + altura, x:x + largura] = origem[:altura, :largura]
+
+def _bytes_da_pagina(path: Path, page_number: int, dpi: int, tamanho_max: tuple[int, int] | None,
+                     dados: bytes | None) -> int:
+    """
+    Roda no processo filho: quantos bytes (RGB) a página decodificada pode ocupar, sem
+    decodificá-la. Em imagens é o tamanho do arquivo (draft/thumbnail só reduzem).
+    """
+    if eh_raster(path):
+        if page_number != 0:
+            raise IndexError(f"Imagem '{path.name}' tem apenas 1 página.")
+        with Image.open(io.BytesIO(dados) if dados is not None else path) as img:
+            return img.width * img.height * 3
+    doc = fitz.open(stream=dados, filetype="pdf") if dados is not None else fitz.open(path)
+    try:
+        _, _, area = _abrir_pagina(doc, page_number, dpi, tamanho_max)
+        return area.width * area.height * 3
+    finally:
+        doc.close()
+
+def _rasterizar_em_memoria_compartilhada(nome: str, path: Path, page_number: int, dpi: int,
+                                         tamanho_max: tuple[int, int] | None, dados: bytes | None) -> tuple[str, tuple[int, int], tuple | None]:
+    """
+    Roda no processo filho: decodifica a página direto no bloco de memória compartilhada
+    'nome' (faixa por faixa, em PDFs) e devolve (modo, tamanho, dpi). Assim os pixels
+    não passam pelo pipe do executor (pickle de centenas de MB). O bloco é do processo
+    principal, que o apaga mesmo se a decodificação falhar.
+    """
+    devolver_memoria_ao_sistema() # Solta o que sobrou da página anterior deste processo
+    shm = shared_memory.SharedMemory(name=nome)
+    try:
+        if eh_raster(path):
+            img = carregar_pagina(path, page_number, dpi, tamanho_max, dados)
+            pixels = img.tobytes()
+            # No Windows/macOS o bloco é arredondado para o tamanho de página da memória
+            shm.buf[:len(pixels)] = pixels
+            return "RGB", img.size, img.info.get('dpi')
+
+        doc = fitz.open(stream=dados, filetype="pdf") if dados is not None else fitz.open(path)
+        try:
+            page, mat, area = _abrir_pagina(doc, page_number, dpi, tamanho_max)
+            destino = np.ndarray((area.height, area.width, 3), dtype=np.uint8, buffer=shm.buf)
+            try:
+                for pix in _pixmaps_da_pagina(page, mat, area):
+                    _colar_pixmap(destino, pix, area)
+                    del pix
+            finally:
+                del destino # O bloco só pode ser fechado sem views abertas sobre ele
+            return "RGB", (area.width, area.height), (mat.a * 72, mat.d * 72)
+        finally:
+            doc.close()
+    finally:
+        shm.close()
+
+def decodificador_em_processos(processos: Executor):
+    """
+    Devolve uma função com a assinatura de carregar_pagina que decodifica em 'processos'.
+    O bloco de memória compartilhada é criado aqui, no processo principal, e só é fechado
+    depois de copiado: no Windows um bloco some quando o último handle é fechado, e
+    quem cria é quem apaga (também quando o filho falha no meio da página).
+    """
+    def decodificar(path: Path, page_number: int = 0, dpi: int = 300, tamanho_max: tuple[int, int] | None = None, dados: bytes | None = None) -> Image.Image:
+        tamanho_bloco = processos.submit(_bytes_da_pagina, path, page_number, dpi, tamanho_max, dados).result()
+        shm = shared_memory.SharedMemory(create=True, size=max(tamanho_bloco, 1))
+        try:
+            modo, tamanho, dpi_pagina = processos.submit(_rasterizar_em_memoria_compartilhada, shm.name, path,
+                                                         page_number, dpi, tamanho_max, dados).result()
+            pixels = shm.buf[:tamanho[0] * tamanho[1] * 3]
+            try:
+                img = Image.frombytes(modo, tamanho, pixels)
+            finally:
+                pixels.release()
+            if dpi_pagina:
+                img.info['dpi'] = dpi_pagina
+            return img
+        finally:
+            shm.close()
+            shm.unlink()
+    return decodificar
+
+# --- Cache de Páginas Decodificadas ---
+# Pode ser usado de várias threads (motor em pipeline): o dict é protegido por
+# _CACHE_TRAVA, e cada página tem sua própria trava para não ser decodificada
+# duas vezes ao mesmo tempo (uma página de 300 DPI pode ter centenas de MB).
+_PAGINAS_CACHE: OrderedDict[tuple, Image.Image] = OrderedDict()
+_CACHE_TRAVA = threading.Lock()
+_TRAVAS_PAGINA: dict[tuple, threading.Lock] = {}
+_limite_cache_bytes = LIMITE_CACHE_PADRAO # Além do limite por quantidade (BASE_CACHE_MAX)
+
+def bytes_imagem(img: Image.Image) -> int:
+    """Memória ocupada pelos pixels da imagem (modos de 1 banda usam 1 byte, os demais 4)."""
+    return img.width * img.height * (1 if img.mode in ('1', 'L', 'P') else BYTES_POR_PIXEL)
+
+def definir_limite_cache(max_bytes: int = LIMITE_CACHE_PADRAO):
+    """Limita a memória ocupada pelas páginas cacheadas (orçamento de memória); sem argumento, volta ao padrão."""
+    global _limite_cache_bytes
+    with _CACHE_TRAVA:
+        _limite_cache_bytes = max_bytes
+        _aplicar_limites_cache()
+
+def limite_cache() -> int:
+    return _limite_cache_bytes
+
+def _aplicar_limites_cache():
+    # Chamar com _CACHE_TRAVA adquirida
+    total = sum(bytes_imagem(img) for img in _PAGINAS_CACHE.values())
+    while _PAGINAS_CACHE and (len(_PAGINAS_CACHE) > BASE_CACHE_MAX or total > _limite_cache_bytes):
+        _, removida = _PAGINAS_CACHE.popitem(last=False)
+        total -= bytes_imagem(removida)
+
+def _chave_cache(path: Path, page_number: int, dpi: float, tamanho_max: tuple[int, int] | None) -> tuple:
+    st = path.stat()
+    # Imagens são decodificadas nos próprios pixels: o DPI pedido não muda o resultado
+    return (str(path), st.st_mtime_ns, st.st_size, page_number, None if eh_raster(path) else dpi, tamanho_max)
+
+def pagina_em_cache(path: Path, page_number: int = 0, dpi: float = 300, tamanho_max: tuple[int, int] | None = None) -> bool:
+    with _CACHE_TRAVA:
+        return _chave_cache(path, page_number, dpi, tamanho_max) in _PAGINAS_CACHE
+
+def _obter_do_cache(chave: tuple, produzir) -> Image.Image:
+    """Devolve a imagem cacheada em 'chave' ou a produz (uma thread por chave) e guarda."""
+    with _CACHE_TRAVA:
+        if chave in _PAGINAS_CACHE:
+            _PAGINAS_CACHE.move_to_end(chave)
+            return _PAGINAS_CACHE[chave]
+        trava = _TRAVAS_PAGINA.setdefault(chave, threading.Lock())
+
+    with trava:
+        with _CACHE_TRAVA:
+            if chave in _PAGINAS_CACHE: # Outra thread decodificou enquanto esperávamos
+                _PAGINAS_CACHE.move_to_end(chave)
+                return _PAGINAS_CACHE[chave]
+
+        img = produzir()
+
+        with _CACHE_TRAVA:
+            # Páginas maiores que o limite inteiro do cache não são guardadas
+            if bytes_imagem(img) <= _limite_cache_bytes:
+                _PAGINAS_CACHE[chave] = img
+                _aplicar_limites_cache()
+            _TRAVAS_PAGINA.pop(chave, None)
+    return img
+
+def carregar_pagina_cache(path: Path, page_number: int = 0, dpi: float = 300, tamanho_max: tuple[int, int] | None = None,
+                          dados: bytes | None = None, decodificar=carregar_pagina) -> Image.Image:
+    """
+    Igual a carregar_pagina, mas reaproveita páginas já decodificadas entre pedidos.
+    A imagem devolvida é compartilhada: quem alterá-la deve restaurar o que mudou
+    (ou trabalhar numa cópia, se houver outras threads usando a mesma página).
+    Chamado de várias threads, 'decodificar' deve ser o de decodificador_em_processos().
+    """
+    img = _obter_do_cache(_chave_cache(path, page_number, dpi, tamanho_max),
+                          lambda: decodificar(path, page_number, dpi, tamanho_max, dados))
+    logger.debug(f"Página {page_number + 1} de '{path.name}' obtida do cache.")
+    return img
+
+def carregar_pagina_no_dpi(path: Path, page_number: int, dpi: float, dados: bytes | None = None,
+                           decodificar=carregar_pagina) -> Image.Image:
+    """
+    Página (via cache) com exatamente 'dpi' (ex.: o verso no DPI da frente). PDFs são
+    rasterizados direto nesse DPI; imagens com outro DPI são reamostradas uma vez e a
+    versão reamostrada também fica no cache, em vez de ser refeita a cada pedido.
+    """
+    if not eh_raster(path):
+        return carregar_pagina_cache(path, page_number, dpi, dados=dados, decodificar=decodificar)
+    original = carregar_pagina_cache(path, page_number, dados=dados, decodificar=decodificar)
+    if abs(dpi / dpi_da_imagem(original) - 1) < 1e-3:
+        return original
+    def reamostrar():
+        with travas_conteudo([(path, page_number, dpi)])[0]: # A original pode ser a frente de outro pedido
+            return reamostrar_para_dpi(original, dpi)
+    return _obter_do_cache(_chave_cache(path, page_number, dpi, None) + ('reamostrada', dpi), reamostrar)
+
+# --- Travas de Conteúdo ---
+# As páginas do cache são compartilhadas entre pedidos. Quem compõe o texto direto na
+# página (e depois restaura) segura a trava dela até restaurar; quem lê os pixels de
+# uma página que pode ser a frente de outro pedido (verso, reamostragem) também.
+_TRAVAS_CONTEUDO: dict[tuple, threading.Lock] = {}
+
+def travas_conteudo(paginas: list[tuple[Path, int, float]]) -> list[threading.Lock]:
+    """
+    Travas das páginas [(arquivo, página, dpi), ...], sem repetição e sempre na mesma
+    ordem: quem precisa de várias as adquire nessa ordem, sem risco de deadlock.
+    """
+    chaves = sorted({(str(path), page_number, 0.0 if eh_raster(path) else float(dpi)) for path, page_number, dpi in paginas})
+    with _CACHE_TRAVA:
+        return [_TRAVAS_CONTEUDO.setdefault(chave, threading.Lock()) for chave in chaves]
+
+def limpar_cache_paginas():
+    with _CACHE_TRAVA:
+        _PAGINAS_CACHE.clear()
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from pathlib import Path
+from PIL import Image, ImageFont
+import fitz # PyMuPDF
+from carregador_bases import EXTENSOES_BASE, dpi_da_imagem, eh_raster
+
+# --- Configuração de Logging ---
+logger = logging.getLogger(__name__)
+
+# --- Definição de Caminhos ---
+BASE_DIR = Path(__file__).parent
+FONT_DIR = BASE_DIR / "fonts"
+PICTURE_DIR = BASE_DIR / "pictures"
+CACHE_DIR = BASE_DIR / ".cache" # Catálogo (gerado, não versionado)
+CATALOGO_FILE = CACHE_DIR / "catalogo_assets.json"
+THUMB_DIR_LEGADO = CACHE_DIR / "thumbs" # Miniaturas do formato 2 (nenhuma UI as usava): removidas
+
+CATALOGO_VERSAO = 3 # Mude se o formato das entradas mudar (força reconstrução)
+EXTENSOES_FONTE = ('.ttf', '.otf')
+
+# --- Funções Helper ---
+def _hash_arquivo(path: Path) -> str:
+    """Calcula o SHA-256 do arquivo lendo em blocos (não carrega tudo na memória)."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+def _listar_arquivos(pasta: Path, extensoes: tuple[str, ...]) -> dict[str, os.stat_result]:
+    """Lista os arquivos da pasta com o stat já resolvido (uma única varredura)."""
+    encontrados = {}
+    try:
+        with os.scandir(pasta) as it:
+            for entry in it:
+                if entry.is_file() and Path(entry.name).suffix.lower() in extensoes:
+                    encontrados[entry.name] = entry.stat()
+    except FileNotFoundError:
+        logger.warning(f"Pasta '{pasta}' não encontrada.")
+    return encontrados
+
+def _entrada_valida(entrada: dict | None, st: os.stat_result) -> bool:
+    """Uma entrada do catálogo só vale se tamanho e mtime ainda batem com o arquivo."""
+    return bool(entrada) and entrada.get('tamanho') == st.st_size and entrada.get('mtime_ns') == st.st_mtime_ns
+
+def _metadados_base(path: Path, st: os.stat_result) -> dict:
+    """Abre a base uma única vez e extrai o que os scripts precisam saber dela."""
+    entrada = {
+        'tamanho': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'sha256': _hash_arquivo(path),
+    }
+
+    if eh_raster(path):
+        with Image.open(path) as img: # Só lê o cabeçalho, não decodifica a imagem
+            entrada.update({
+                'tipo': 'raster',
+                'paginas': 1,
+                # Imagens: dimensões em pixels
+                'dimensoes': [list(img.size)],
+                'dpi': round(dpi_da_imagem(img), 2),
+            })
+    else:
+        doc = fitz.open(path)
+        try:
+            entrada.update({
+                'tipo': 'pdf',
+                'paginas': len(doc),
+                # PDFs: dimensões em pontos (1/72 pol.), uma por página: [largura, altura]
+                'dimensoes': [[round(p.rect.width, 2), round(p.rect.height, 2)] for p in doc],
+            })
+        finally:
+            doc.close()
+    return entrada
+
+def _metadados_fonte(path: Path, st: os.stat_result) -> dict:
+    family, style = ImageFont.truetype(str(path), 12).getname()
+    return {
+        'tamanho': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'sha256': _hash_arquivo(path),
+        'familia': family,
+        'estilo': style,
+    }
+
+def _sincronizar(secao: dict, pasta: Path, extensoes: tuple[str, ...], extrair) -> bool:
+    """Atualiza uma seção do catálogo. Retorna True se algo mudou."""
+    arquivos = _listar_arquivos(pasta, extensoes)
+    mudou = False
+
+    for nome in list(secao):
+        if nome not in arquivos:
+            logger.info(f"Catálogo: '{nome}' removido.")
+            del secao[nome]
+            mudou = True
+
+    for nome, st in arquivos.items():
+        if _entrada_valida(secao.get(nome), st):
+            continue
+        try:
+            secao[nome] = extrair(pasta / nome, st)
+            logger.info(f"Catálogo: '{nome}' indexado.")
+        except Exception as e:
+            logger.error(f"Catálogo: erro ao indexar '{nome}': {e}")
+            secao.pop(nome, None)
+        mudou = True
+
+    return mudou
+
+# --- API Pública ---
+def carregar_catalogo() -> dict:
+    """Lê o catálogo salvo (sem verificar se está atualizado)."""
+    try:
+        with open(CATALOGO_FILE, 'r', encoding='utf-8') as f:
+            catalogo = json.load(f)
+        if catalogo.get('versao') == CATALOGO_VERSAO:
+            return catalogo
+        logger.info("Catálogo em formato antigo. Será reconstruído.")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Catálogo '{CATALOGO_FILE}' ilegível ({e}). Será reconstruído.")
+    return {'versao': CATALOGO_VERSAO, 'bases': {}, 'fontes': {}}
+
+def salvar_catalogo(catalogo: dict):
+    """
+    Grava o catálogo de forma atômica (arquivo temporário + rename). O temporário tem
+    nome único porque vários trabalhadores podem atualizar o catálogo ao mesmo tempo.
+    """
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = CATALOGO_FILE.with_name(f"{CATALOGO_FILE.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(catalogo, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, CATALOGO_FILE)
+
+def atualizar_catalogo() -> dict:
+    """
+    Carrega o catálogo e reindexa apenas os arquivos novos ou alterados
+    (detectados por tamanho/mtime). Arquivos inalterados não são abertos.
+    """
+    catalogo = carregar_catalogo()
+    if THUMB_DIR_LEGADO.exists():
+        shutil.rmtree(THUMB_DIR_LEGADO, ignore_errors=True)
+        logger.info(f"Miniaturas antigas removidas de '{THUMB_DIR_LEGADO}'.")
+    mudou_bases = _sincronizar(catalogo['bases'], PICTURE_DIR, EXTENSOES_BASE, _metadados_base)
+    mudou_fontes = _sincronizar(catalogo['fontes'], FONT_DIR, EXTENSOES_FONTE, _metadados_fonte)
+    if mudou_bases or mudou_fontes:
+        try:
+            salvar_catalogo(catalogo)
+        except Exception as e:
+            logger.warning(f"Não foi possível salvar o catálogo: {e}")
+    return catalogo
+
+def listar_bases(catalogo: dict) -> list[str]:
+    return sorted(catalogo['bases'])
+
+def listar_fontes(catalogo: dict) -> list[str]:
+    return sorted(catalogo['fontes'])
+
+def info_base(catalogo: dict, nome: str) -> dict | None:
+    return catalogo['bases'].get(nome)
+
+def tamanho_pagina_pixels(entrada: dict, page_number: int = 0, dpi: int = 300) -> tuple[int, int]:
+    """Tamanho em pixels da página decodificada em resolução total (sem abrir o arquivo)."""
+    largura, altura = entrada['dimensoes'][page_number]
+    if entrada.get('tipo') == 'raster':
+        return int(largura), int(altura)
+    return round(largura * dpi / 72), round(altura * dpi / 72)
+
+def tamanho_pagina_pontos(entrada: dict, page_number: int = 0) -> tuple[float, float]:
+    """Tamanho físico da página em pontos (1/72 pol.); imagens usam o DPI gravado no arquivo."""
+    largura, altura = entrada['dimensoes'][page_number]
+    if entrada.get('tipo') == 'raster':
+        return largura * 72 / entrada['dpi'], altura * 72 / entrada['dpi']
+    return largura, altura
+
+def dpi_pagina(entrada: dict, dpi: int = 300) -> float:
+    """DPI com que a página sai decodificada: o de rasterização (PDF) ou o do arquivo (imagem)."""
+    return entrada['dpi'] if entrada.get('tipo') == 'raster' else dpi
@@ -0,0 +1,192 @@
+import json
+import logging
+import math
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# --- Configuração de Logging ---
+logger = logging.getLogger(__name__)
+
+# --- Definição de Caminhos ---
+BASE_DIR = Path(__file__).parent
+FONT_DIR = BASE_DIR / "fonts"
+
+GLOBAL_DEFAULT_FONT = "sao.ttf" # Mude para sua fonte padrão
+SPRITE_CACHE_MAX = 256 # Quantos textos renderizados manter em memória
+
+# Desenho "fantasma" usado só para medir texto (não aloca uma página)
+_MEDIDOR = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+
+# --- Funções Helper de Desenho ---
+def get_font_line_height(font: ImageFont.FreeTypeFont) -> float:
+    try:
+        bbox = font.getbbox("Aghy")
+        return (bbox[3] - bbox[1]) * 1.25
+    except AttributeError:
+        # Fallback
+        mask = font.getmask("hg")
+        return mask.size[1] * 1.25
+
+def resolver_nome_fonte(config: dict, font_override: str | None = None) -> str:
+    """Decide qual arquivo de fonte usar (override > template > padrão global)."""
+    font_name_to_use = GLOBAL_DEFAULT_FONT
+    if config.get('font_name'):
+        font_name_to_use = config['font_name']
+    if font_override:
+        font_name_to_use = font_override
+
+    if not (FONT_DIR / font_name_to_use).exists():
+        logger.warning(f"Fonte '{font_name_to_use}' não encontrada. Usando fallback '{GLOBAL_DEFAULT_FONT}'.")
+        font_name_to_use = GLOBAL_DEFAULT_FONT
+        if not (FONT_DIR / font_name_to_use).exists():
+            raise FileNotFoundError(f"Fonte de fallback '{GLOBAL_DEFAULT_FONT}' não encontrada em {FONT_DIR}")
+    return font_name_to_use
+
+@lru_cache(maxsize=32)
+def carregar_fonte(font_name: str, font_size: int) -> ImageFont.FreeTypeFont:
+    # Abrir o arquivo de fonte é caro; o mesmo (fonte, tamanho) se repete no lote inteiro
+    return ImageFont.truetype(str(FONT_DIR / font_name), font_size)
+
+def medir_linha(line: str, font: ImageFont.FreeTypeFont) -> tuple[float, float]:
+    """Retorna (largura, deslocamento do topo) de uma linha."""
+    try:
+        line_bbox = _MEDIDOR.textbbox((0, 0), line, font=font)
+        return line_bbox[2] - line_bbox[0], line_bbox[1]
+    except AttributeError:
+        try:
+            bbox = font.getbbox(line)
+            return bbox[2] - bbox[0], bbox[1]
+        except AttributeError:
+            mask = font.getmask(line)
+            return mask.size[0], 0
+
+def quebrar_linhas(config: dict, text_input: str, font: ImageFont.FreeTypeFont) -> list[str]:
+    """Quebra o texto em linhas que cabem em 'max_width_pixels' (sem cortar por 'max_lines')."""
+    max_pixel_width = config.get('max_width_pixels', 9999)
+    lines = []
+    current_line = ""
+
+    for word in text_input.split():
+        test_line = f"{current_line} {word}".strip()
+        line_width, _ = medir_linha(test_line, font)
+
+        if line_width <= max_pixel_width:
+            current_line = test_line
+        else:
+            lines.append(current_line)
+            current_line = word
+
+    lines.append(current_line)
+    return lines
+
+def layout_templated_text(config: dict, text_input: str, font: ImageFont.FreeTypeFont) -> list[tuple[float, float, str]]:
+    """
+    Calcula onde cada linha será desenhada, em coordenadas da página.
+    Retorna uma lista de (x, y, linha), já com o corte de 'max_lines' aplicado.
+    """
+    align = config.get('align', 'left')
+    max_pixel_width = config.get('max_width_pixels', 9999)
+
+    lines = quebrar_linhas(config, text_input, font)
+    if 'max_lines' in config:
+        lines = lines[:config['max_lines']]
+
+    current_y = config.get('pos_y', 10)
+    line_height = get_font_line_height(font)
+    posicoes = []
+
+    for line in lines:
+        line_width, line_top_offset = medir_linha(line, font)
+
+        draw_x = config.get('pos_x', 10)
+
+        if align == "center":
+            draw_x = config.get('pos_x', 10) + (max_pixel_width / 2) - (line_width / 2)
+        elif align == "right":
+            draw_x = config.get('pos_x', 10) + max_pixel_width - line_width
+
+        posicoes.append((draw_x, current_y - line_top_offset, line))
+        current_y += line_height
+
+    return posicoes
+
+# --- Cache de Sprites de Texto ---
+# Chave: (texto, config do template serializada, fonte resolvida) -> (sprite RGBA, (x, y) na página)
+_SPRITE_CACHE: OrderedDict[tuple, tuple[Image.Image, tuple[int, int]] | None] = OrderedDict()
+# Sprites são pequenos e quase sempre vêm do cache; uma trava única basta para
+# usar o cache (e as fontes FreeType compartilhadas) a partir de várias threads
+_SPRITE_TRAVA = threading.RLock()
+
+def render_text_sprite(config: dict, text_input: str, font_override: str | None = None) -> tuple[Image.Image, tuple[int, int]] | None:
+    """
+    Renderiza o texto em uma camada RGBA transparente do tamanho exato do texto,
+    pronta para ser composta sobre qualquer base que use o mesmo template.
+    Retorna (sprite, (x, y)) ou None se não houver nada a desenhar.
+    Resultados são cacheados: nomes repetidos no lote não são redesenhados.
+    """
+    with _SPRITE_TRAVA:
+        return _render_text_sprite(config, text_input, font_override)
+
+def _render_text_sprite(config: dict, text_input: str, font_override: str | None) -> tuple[Image.Image, tuple[int, int]] | None:
+    font_name = resolver_nome_fonte(config, font_override)
+    chave = (text_input, json.dumps(config, sort_keys=True), font_name)
+    if chave in _SPRITE_CACHE:
+        _SPRITE_CACHE.move_to_end(chave)
+        return _SPRITE_CACHE[chave]
+
+    font = carregar_fonte(font_name, config.get('font_size', 50))
+    fill = config.get('color', '#000000')
+    posicoes = [p for p in layout_templated_text(config, text_input, font) if p[2]]
+
+    resultado = None
+    if posicoes:
+        # Caixa que envolve todas as linhas, em coordenadas inteiras da página
+        caixas = [_MEDIDOR.textbbox((x, y), line, font=font) for x, y, line in posicoes]
+        x0 = math.floor(min(c[0] for c in caixas))
+        y0 = math.floor(min(c[1] for c in caixas))
+        x1 = math.ceil(max(c[2] for c in caixas))
+        y1 = math.ceil(max(c[3] for c in caixas))
+
+        sprite = Image.new("RGBA", (max(x1 - x0, 1), max(y1 - y0, 1)), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(sprite)
+        for draw_x, draw_y, line in posicoes:
+            draw.text((draw_x - x0, draw_y - y0), line, font=font, fill=fill)
+        resultado = (sprite, (x0, y0))
+
+    _SPRITE_CACHE[chave] = resultado
+    if len(_SPRITE_CACHE) > SPRITE_CACHE_MAX:
+        _SPRITE_CACHE.popitem(last=False)
+    return resultado
+
+def compor_sprite(img: Image.Image, sprite: Image.Image, origem: tuple[int, int]) -> tuple[Image.Image, tuple[int, int]] | None:
+    """
+    Faz o alpha-blend do sprite RGBA sobre a página RGB, no lugar.
+    Só a região coberta pelo sprite é lida e reescrita (a página nunca é convertida
+    nem copiada), recortando o que cair fora da página.
+    Retorna a região original (imagem, posição), para restaurar_regiao().
+    """
+    if img.mode != "RGB":
+        raise ValueError(f"A página deve estar em RGB para compor o texto (recebido: {img.mode}).")
+
+    x, y = origem
+    caixa = (max(x, 0), max(y, 0), min(x + sprite.width, img.width), min(y + sprite.height, img.height))
+    if caixa[0] >= caixa[2] or caixa[1] >= caixa[3]:
+        return None
+
+    camada = np.asarray(sprite.crop((caixa[0] - x, caixa[1] - y, caixa[2] - x, caixa[3] - y)), dtype=np.uint16)
+    regiao_original = img.crop(caixa)
+    fundo = np.asarray(regiao_original, dtype=np.uint16)
+
+    alpha = camada[..., 3:4]
+    # (texto * a + fundo * (255 - a)) / 255, com arredondamento, em inteiros
+    mistura = (camada[..., :3] * alpha + fundo * (255 - alpha) + 127) // 255
+    img.paste(Image.fromarray(mistura.astype(np.uint8), "RGB"), caixa[:2])
+    return regiao_original, caixa[:2]
+
+def restaurar_regiao(img: Image.Image, regiao: tuple[Image.Image, tuple[int, int]]):
+    """Desfaz um compor_sprite(), devolvendo os pixels originais da região."""
+    img.paste(*regiao)
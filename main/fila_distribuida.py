@@ -0,0 +1,307 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from validacao_pedidos import chave_pedido
+
+# --- Configuração de Logging ---
+logger = logging.getLogger(__name__)
+
+# Execução distribuída: vários processos (em máquinas diferentes) dividem um lote
+# usando só uma pasta compartilhada (NFS/SMB), sem broker. Layout de uma execução:
+#   <fila>/<id_execucao>/manifesto.json         -> nº de shards e pedidos por shard
+#   <fila>/<id_execucao>/shards/shard-0007.json  -> [[índice global, pedido], ...]
+#   <fila>/<id_execucao>/leases/shard-0007.lease -> dono do shard (token); só é criado e removido, nunca reescrito
+#   <fila>/<id_execucao>/leases/shard-0007.lease.<token>.hb -> validade renovada pelo heartbeat do dono
+#   <fila>/<id_execucao>/resultados/shard-0007.json
+#   <fila>/<id_execucao>/relatorio.json          -> relatório consolidado da execução
+# Entrega "pelo menos uma vez": se um trabalhador travar além da validade do lease,
+# outro reprocessa o shard. Isso é seguro porque a gravação dos PDFs é atômica e o
+# resultado de um pedido não depende de quem o renderiza.
+# Leases usam o relógio de cada máquina: os hosts precisam estar sincronizados (NTP).
+
+SHARDS_PADRAO = 16
+LEASE_SEGUNDOS_PADRAO = 60 # Sem heartbeat por esse tempo, o shard pode ser retomado
+ESPERA_SEGUNDOS = 5 # Intervalo entre tentativas quando todos os shards restantes têm dono
+
+def id_trabalhador_padrao() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+# --- Funções Helper ---
+def _gravar_json_atomico(path: Path, dados):
+    """Temporário com nome único (várias máquinas escrevem na mesma pasta) + rename."""
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _ler_json(path: Path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def _nome_shard(n: int) -> str:
+    return f"shard-{n:04d}"
+
+def id_execucao(pedidos: list[dict], n_shards: int, versoes: dict | None = None) -> str:
+    """
+    Mesmo lote + mesmo nº de shards + mesmos assets = mesma execução, em qualquer máquina.
+    'versoes' identifica o conteúdo dos assets (hash das bases e fontes, config dos
+    templates): rodar de novo depois de corrigir um asset gera uma execução nova, em vez
+    de devolver o relatório da anterior.
+    """
+    conteudo = json.dumps([pedidos, versoes], sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return f"{hashlib.sha256(conteudo).hexdigest()[:16]}-{n_shards}"
+
+def shard_do_pedido(pedido: dict, n_shards: int) -> int:
+    """
+    Partição determinística (sha1, não hash(): esse muda a cada processo).
+    Pedidos idênticos caem no mesmo shard, para a deduplicação do motor continuar valendo.
+    """
+    chave = chave_pedido(pedido) or pedido.get('output_pdf')
+    digest = hashlib.sha1(json.dumps(chave, ensure_ascii=False).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % n_shards
+
+def particionar(pedidos: list[dict], n_shards: int) -> list[list[tuple[int, dict]]]:
+    shards = [[] for _ in range(n_shards)]
+    for i, pedido in enumerate(pedidos):
+        shards[shard_do_pedido(pedido, n_shards)].append((i, pedido))
+    return shards
+
+# --- Leases ---
+def _caminho_heartbeat(path: Path, token: str) -> Path:
+    return path.with_name(f"{path.name}.{token}.hb")
+
+def _validade(path: Path, lease: dict) -> float:
+    """Validade de um lease: a maior entre a do arquivo do lease e a do heartbeat do seu token."""
+    heartbeat = _ler_json(_caminho_heartbeat(path, lease.get('token', ''))) or {}
+    return max(lease.get('expira_em', 0), heartbeat.get('expira_em', 0))
+
+class Lease:
+    """
+    Posse de um shard. O arquivo é criado com O_CREAT|O_EXCL (só um trabalhador
+    consegue) e não é mais reescrito: a thread de heartbeat renova um arquivo à parte,
+    com o token no nome. Assim um heartbeat atrasado nunca sobrescreve o lease de um
+    novo dono. Se outro trabalhador retomar o shard (lease vencido), 'perdido' vira True.
+    """
+
+    def __init__(self, path: Path, trabalhador: str, duracao: float):
+        self.path = path
+        self.trabalhador = trabalhador
+        self.duracao = duracao
+        self.token = uuid.uuid4().hex
+        self.perdido = False
+        self._heartbeat_path = _caminho_heartbeat(path, self.token)
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _conteudo(self) -> dict:
+        return {'trabalhador': self.trabalhador, 'token': self.token, 'expira_em': time.time() + self.duracao}
+
+    def adquirir(self) -> bool:
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self._conteudo(), f)
+        self._thread = threading.Thread(target=self._heartbeat, name=f"heartbeat-{self.path.stem}", daemon=True)
+        self._thread.start()
+        return True
+
+    def _heartbeat(self):
+        while not self._parar.wait(self.duracao / 3):
+            atual = _ler_json(self.path)
+            if not atual or atual.get('token') != self.token:
+                self.perdido = True
+                logger.warning(f"Lease de '{self.path.stem}' foi retomado por outro trabalhador.")
+                return
+            # Só o arquivo deste token: mesmo que o lease seja retomado entre a leitura e a
+            # gravação, o do novo dono (outro token) não é tocado
+            _gravar_json_atomico(self._heartbeat_path, {'expira_em': time.time() + self.duracao})
+
+    def liberar(self):
+        self._parar.set()
+        if self._thread:
+            self._thread.join()
+        atual = _ler_json(self.path)
+        if atual and atual.get('token') == self.token:
+            self.path.unlink(missing_ok=True)
+        self._heartbeat_path.unlink(missing_ok=True)
+
+def retomar_se_vencido(path: Path, lease_segundos: float) -> bool:
+    """
+    Remove um lease vencido (dono travou ou caiu). O arquivo é primeiro renomeado
+    para um nome único: se dois trabalhadores tentarem ao mesmo tempo, só um consegue.
+    Se nesse meio-tempo o lease foi trocado ou renovado, ele é devolvido.
+    """
+    visto = _ler_json(path)
+    if visto is None:
+        # Ilegível: pode ter acabado de ser criado e ainda não ter conteúdo
+        try:
+            if time.time() - path.stat().st_mtime < lease_segundos:
+                return False
+        except FileNotFoundError:
+            return False
+    elif _validade(path, visto) > time.time():
+        return False
+    lapide = path.with_name(f"{path.name}.{uuid.uuid4().hex}.vencido")
+    try:
+        os.rename(path, lapide)
+    except FileNotFoundError:
+        return False
+    removido = _ler_json(lapide)
+    if visto and (not removido or removido.get('token') != visto.get('token') or _validade(path, removido) > time.time()):
+        # Não era o lease que vimos vencer, ou o dono renovou agora: devolve. link() não
+        # sobrescreve: se outro trabalhador já criou um lease novo, o dele fica
+        try:
+            os.link(lapide, path)
+        except FileExistsError:
+            pass
+        lapide.unlink(missing_ok=True)
+        return False
+    lapide.unlink(missing_ok=True)
+    if removido:
+        _caminho_heartbeat(path, removido.get('token', '')).unlink(missing_ok=True)
+    logger.warning(f"Lease vencido de '{path.stem}' (trabalhador '{(visto or {}).get('trabalhador')}') retomado.")
+    return True
+
+# --- Execução ---
+def preparar_execucao(fila_dir: Path, pedidos: list[dict], n_shards: int = SHARDS_PADRAO,
+                      versoes: dict | None = None) -> Path:
+    """
+    Cria (ou reaproveita) a pasta da execução com os shards. Todos os trabalhadores
+    podem chamar: o conteúdo é determinístico e cada arquivo é gravado por rename atômico.
+    """
+    exec_dir = fila_dir / id_execucao(pedidos, n_shards, versoes)
+    if _ler_json(exec_dir / "manifesto.json"):
+        return exec_dir
+
+    for sub in ("shards", "leases", "resultados"):
+        (exec_dir / sub).mkdir(parents=True, exist_ok=True)
+    shards = particionar(pedidos, n_shards)
+    for n, itens in enumerate(shards):
+        _gravar_json_atomico(exec_dir / "shards" / f"{_nome_shard(n)}.json", itens)
+    _gravar_json_atomico(exec_dir / "manifesto.json", {
+        'shards': n_shards,
+        'total_pedidos': len(pedidos),
+        'pedidos_por_shard': [len(itens) for itens in shards],
+        'criado_em': time.time(),
+    })
+    logger.info(f"Execução '{exec_dir.name}' preparada: {len(pedidos)} pedidos em {n_shards} shards.")
+    return exec_dir
+
+def _shards_pendentes(exec_dir: Path, n_shards: int) -> list[int]:
+    prontos = {p.stem for p in (exec_dir / "resultados").glob("shard-*.json")}
+    return [n for n in range(n_shards) if _nome_shard(n) not in prontos]
+
+def executar_trabalhador(exec_dir: Path, processar_shard, trabalhador: str | None = None,
+                         lease_segundos: float = LEASE_SEGUNDOS_PADRAO) -> int:
+    """
+    Loop de um trabalhador: pega um shard livre, processa, grava o resultado e repete.
+    Quando só restam shards com dono, espera e retoma os que tiverem lease vencido.
+    'processar_shard(nome, itens)' recebe o nome do shard e [(índice global, pedido), ...] e devolve um dict
+    com 'sucesso', 'falhas' e 'relatorio' (o de validar_pedidos).
+    Retorna quantos shards este trabalhador processou.
+    """
+    trabalhador = trabalhador or id_trabalhador_padrao()
+    n_shards = _ler_json(exec_dir / "manifesto.json")['shards']
+    processados = 0
+
+    while True:
+        pendentes = _shards_pendentes(exec_dir, n_shards)
+        if not pendentes:
+            break
+        # Ordem embaralhada por trabalhador: menos disputa pelos mesmos leases
+        random.Random(trabalhador).shuffle(pendentes)
+
+        pegou = False
+        for n in pendentes:
+            nome = _nome_shard(n)
+            lease_path = exec_dir / "leases" / f"{nome}.lease"
+            lease = Lease(lease_path, trabalhador, lease_segundos)
+            if not lease.adquirir():
+                if not retomar_se_vencido(lease_path, lease_segundos) or not lease.adquirir():
+                    continue
+            try:
+                if (exec_dir / "resultados" / f"{nome}.json").exists():
+                    continue # Outro trabalhador terminou enquanto olhávamos
+                pegou = True
+                _processar_um_shard(exec_dir, nome, lease, processar_shard)
+                processados += 1
+            finally:
+                lease.liberar()
+
+        if not pegou:
+            logger.info(f"Trabalhador '{trabalhador}': {len(pendentes)} shard(s) em andamento em outros trabalhadores. Aguardando...")
+            time.sleep(ESPERA_SEGUNDOS)
+
+    logger.info(f"Trabalhador '{trabalhador}' terminou: {processados} shard(s) processados.")
+    return processados
+
+def _processar_um_shard(exec_dir: Path, nome: str, lease: Lease, processar_shard):
+    itens = _ler_json(exec_dir / "shards" / f"{nome}.json")
+    logger.info(f"Trabalhador '{lease.trabalhador}' processando '{nome}' ({len(itens)} pedidos)...")
+    inicio = time.time()
+    resultado = processar_shard(nome, [(i, pedido) for i, pedido in itens])
+
+    # Índices do relatório de validação são locais ao shard; volta para os do lote
+    indices = [i for i, _ in itens]
+    for r in resultado['relatorio']['pedidos']:
+        r['indice'] = indices[r['indice'] - 1] + 1
+
+    if lease.perdido:
+        logger.warning(f"'{nome}' terminou depois de perder o lease; o resultado é gravado mesmo assim (idempotente).")
+    _gravar_json_atomico(exec_dir / "resultados" / f"{nome}.json", {
+        'shard': nome,
+        'trabalhador': lease.trabalhador,
+        'inicio': inicio,
+        'duracao_s': round(time.time() - inicio, 2),
+        'sucesso': resultado['sucesso'],
+        'falhas': resultado['falhas'],
+        'relatorio': resultado['relatorio'],
+    })
+
+def consolidar_resultados(exec_dir: Path) -> dict:
+    """Junta os resultados dos shards num relatório único da execução (relatorio.json)."""
+    manifesto = _ler_json(exec_dir / "manifesto.json")
+    resultados = [_ler_json(p) for p in sorted((exec_dir / "resultados").glob("shard-*.json"))]
+    resultados = [r for r in resultados if r]
+
+    custo = {}
+    for r in resultados:
+        for campo, valor in r['relatorio']['custo_estimado'].items():
+            custo[campo] = max(custo.get(campo, 0), valor) if campo == 'maior_pagina_mb' else round(custo.get(campo, 0) + valor, 1)
+
+    relatorio = {
+        'execucao': exec_dir.name,
+        'shards': manifesto['shards'],
+        'shards_concluidos': len(resultados),
+        'total': sum(r['relatorio']['total'] for r in resultados),
+        'validos': sum(r['relatorio']['validos'] for r in resultados),
+        'invalidos': sum(r['relatorio']['invalidos'] for r in resultados),
+        'com_avisos': sum(r['relatorio']['com_avisos'] for r in resultados),
+        'sucesso': sum(r['sucesso'] for r in resultados),
+        'falhas': sum(r['falhas'] for r in resultados),
+        'custo_estimado': custo,
+        'pedidos': sorted((p for r in resultados for p in r['relatorio']['pedidos']), key=lambda p: p['indice']),
+        'por_trabalhador': {},
+    }
+    for r in resultados:
+        dados = relatorio['por_trabalhador'].setdefault(r['trabalhador'], {'shards': 0, 'pedidos': 0, 'ocupado_s': 0.0})
+        dados['shards'] += 1
+        dados['pedidos'] += r['relatorio']['total']
+        dados['ocupado_s'] = round(dados['ocupado_s'] + r['duracao_s'], 2)
+
+    _gravar_json_atomico(exec_dir / "relatorio.json", relatorio)
+    return relatorio
@@ -4,6 +4,8 @@ import json
 from pathlib import Path
 import logging
 from tkinter import messagebox
+from catalogo_assets import atualizar_catalogo, listar_bases, listar_fontes
+from repositorio_templates import RepositorioTemplates
 
 # --- Configuração de Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -11,37 +13,28 @@ logger = logging.getLogger(__name__)
 
 # --- Definição de Caminhos ---
 BASE_DIR = Path(__file__).parent
-TEMPLATE_CONFIG_FILE = BASE_DIR / "templates.json"
 FONT_DIR = BASE_DIR / "fonts"
-PICTURE_DIR = BASE_DIR / "pictures" # Onde os PDFs base estão
+PICTURE_DIR = BASE_DIR / "pictures" # Onde as bases (PDF ou JPG/PNG) estão
 OUTPUT_JSON_FILE = BASE_DIR / "pedidos_pdf_duas_paginas.json" # O JSON que será gerado
 
 # --- Carregar Configs, Fontes e PDFs Base ---
-TEMPLATES_CONFIG = {}
-try:
-    with open(TEMPLATE_CONFIG_FILE, 'r', encoding='utf-8') as f:
-        TEMPLATES_CONFIG = json.load(f)
-    logger.info(f"Carregados {len(TEMPLATES_CONFIG)} templates de '{TEMPLATE_CONFIG_FILE}'")
-except Exception as e:
-    logger.critical(f"ERRO CRÍTICO ao carregar 'templates.json': {e}")
+# Templates: um arquivo por template; a lista da tela acompanha as edições do editor
+REPOSITORIO_TEMPLATES = RepositorioTemplates()
+logger.info(f"Carregados {len(REPOSITORIO_TEMPLATES.snapshot())} templates de '{REPOSITORIO_TEMPLATES.pasta}'")
+RECARREGAR_TEMPLATES_MS = 2000 # A cada quanto tempo a tela verifica templates novos/alterados
 
-AVAILABLE_FONTS = [""] # Opção para não usar override
+# Fontes e PDFs base vêm do catálogo (só reabre arquivos novos ou alterados)
+CATALOGO = {'bases': {}, 'fontes': {}}
 try:
-    for font_file in FONT_DIR.iterdir():
-        if font_file.is_file() and (font_file.suffix.lower() == ".ttf" or font_file.suffix.lower() == ".otf"):
-            AVAILABLE_FONTS.append(font_file.name)
-    AVAILABLE_FONTS.sort()
+    CATALOGO = atualizar_catalogo()
 except Exception as e:
-    logger.warning(f"Não foi possível listar fontes em '{FONT_DIR}': {e}")
+    logger.warning(f"Não foi possível atualizar o catálogo de assets: {e}")
 
-AVAILABLE_BASE_PDFS = []
-try:
-    AVAILABLE_BASE_PDFS = sorted([f.name for f in PICTURE_DIR.iterdir() if f.suffix.lower() == '.pdf'])
-    if not AVAILABLE_BASE_PDFS:
-        AVAILABLE_BASE_PDFS = ["(Nenhum PDF encontrado em /pictures)"]
-except FileNotFoundError:
-    logger.warning(f"Pasta de PDFs base '{PICTURE_DIR}' não encontrada.")
-    AVAILABLE_BASE_PDFS = ["(Nenhuma pasta /pictures)"]
+AVAILABLE_FONTS = [""] + listar_fontes(CATALOGO) # Opção vazia para não usar override
+
+AVAILABLE_BASE_PDFS = listar_bases(CATALOGO)
+if not AVAILABLE_BASE_PDFS:
+    AVAILABLE_BASE_PDFS = ["(Nenhuma base encontrada em /pictures)"]
 
 # --- Configuração da UI ---
 ctk.set_appearance_mode("System")
@@ -57,7 +50,9 @@ class PedidoApp(ctk.CTk):
         # Variáveis de estado da UI
         self.output_pdf_var = ctk.StringVar(value="")
         self.input_pdf_var = ctk.StringVar(value=AVAILABLE_BASE_PDFS[0])
-        self.template_id_var = ctk.StringVar(value=list(TEMPLATES_CONFIG.keys())[0] if TEMPLATES_CONFIG else "")
+        self.input_verso_var = ctk.StringVar(value="") # Verso em arquivo separado (opcional)
+        templates = REPOSITORIO_TEMPLATES.snapshot()
+        self.template_id_var = ctk.StringVar(value=next(iter(templates), ""))
         self.text_var = ctk.StringVar(value="")
         self.font_override_var = ctk.StringVar(value=AVAILABLE_FONTS[0])
 
@@ -78,25 +73,30 @@ class PedidoApp(ctk.CTk):
         ctk.CTkEntry(self.form_frame, textvariable=self.output_pdf_var, placeholder_text="ex: pedido_cliente_jose.pdf").grid(row=1, column=1, padx=5, pady=5, sticky="ew")
         
         # --- Linha 2: PDF Base de Entrada ---
-        ctk.CTkLabel(self.form_frame, text="2. PDF Base de 2 Páginas:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        ctk.CTkLabel(self.form_frame, text="2. Base (PDF de 2 Páginas ou Imagem):").grid(row=2, column=0, padx=5, pady=5, sticky="w")
         ctk.CTkOptionMenu(self.form_frame, variable=self.input_pdf_var, values=AVAILABLE_BASE_PDFS).grid(row=2, column=1, padx=5, pady=5, sticky="ew")
 
+        # --- Linha 2b: Verso em arquivo separado (ex: imagem JPG do verso) ---
+        ctk.CTkLabel(self.form_frame, text="2b. Verso Separado (opcional):").grid(row=3, column=0, padx=5, pady=5, sticky="w")
+        ctk.CTkOptionMenu(self.form_frame, variable=self.input_verso_var, values=[""] + listar_bases(CATALOGO)).grid(row=3, column=1, padx=5, pady=5, sticky="ew")
+
         # --- Linha 3: Template ID (da Capa) ---
-        ctk.CTkLabel(self.form_frame, text="3. Template da Capa (ID):").grid(row=3, column=0, padx=5, pady=5, sticky="w")
-        template_keys = list(TEMPLATES_CONFIG.keys()) if TEMPLATES_CONFIG else ["(Nenhum template salvo)"]
-        ctk.CTkOptionMenu(self.form_frame, variable=self.template_id_var, values=template_keys).grid(row=3, column=1, padx=5, pady=5, sticky="ew")
+        ctk.CTkLabel(self.form_frame, text="3. Template da Capa (ID):").grid(row=4, column=0, padx=5, pady=5, sticky="w")
+        self.template_menu = ctk.CTkOptionMenu(self.form_frame, variable=self.template_id_var, values=self._template_keys())
+        self.template_menu.grid(row=4, column=1, padx=5, pady=5, sticky="ew")
+        self.after(RECARREGAR_TEMPLATES_MS, self._recarregar_templates)
 
         # --- Linha 4: Texto Personalizado ---
-        ctk.CTkLabel(self.form_frame, text="4. Texto Personalizado:").grid(row=4, column=0, padx=5, pady=5, sticky="w")
-        ctk.CTkEntry(self.form_frame, textvariable=self.text_var, placeholder_text="ex: Ana Clara Silva").grid(row=4, column=1, padx=5, pady=5, sticky="ew")
+        ctk.CTkLabel(self.form_frame, text="4. Texto Personalizado:").grid(row=5, column=0, padx=5, pady=5, sticky="w")
+        ctk.CTkEntry(self.form_frame, textvariable=self.text_var, placeholder_text="ex: Ana Clara Silva").grid(row=5, column=1, padx=5, pady=5, sticky="ew")
 
         # --- Linha 5: Fonte Override (Opcional) ---
-        ctk.CTkLabel(self.form_frame, text="5. Fonte Override (opcional):").grid(row=5, column=0, padx=5, pady=5, sticky="w")
-        ctk.CTkOptionMenu(self.form_frame, variable=self.font_override_var, values=AVAILABLE_FONTS).grid(row=5, column=1, padx=5, pady=5, sticky="ew")
+        ctk.CTkLabel(self.form_frame, text="5. Fonte Override (opcional):").grid(row=6, column=0, padx=5, pady=5, sticky="w")
+        ctk.CTkOptionMenu(self.form_frame, variable=self.font_override_var, values=AVAILABLE_FONTS).grid(row=6, column=1, padx=5, pady=5, sticky="ew")
 
         # --- Botão para Adicionar Pedido ---
         self.add_pedido_button = ctk.CTkButton(self.form_frame, text="Adicionar Pedido ao Lote", command=self._add_pedido)
-        self.add_pedido_button.grid(row=6, column=0, columnspan=2, padx=5, pady=10, sticky="ew")
+        self.add_pedido_button.grid(row=7, column=0, columnspan=2, padx=5, pady=10, sticky="ew")
 
         # --- Lista de Pedidos Adicionados ---
         ctk.CTkLabel(self, text="Lote de Pedidos a Gerar:").pack(padx=20, pady=(10,0), anchor="w")
@@ -108,9 +108,21 @@ class PedidoApp(ctk.CTk):
         self.generate_json_button = ctk.CTkButton(self, text="GERAR ARQUIVO JSON DE PEDIDOS", command=self._generate_final_json)
         self.generate_json_button.pack(padx=20, pady=20, fill="x")
 
+    def _template_keys(self) -> list[str]:
+        return list(REPOSITORIO_TEMPLATES.snapshot()) or ["(Nenhum template salvo)"]
+
+    def _recarregar_templates(self):
+        """Pega templates salvos no editor com esta tela aberta (só relê os alterados)."""
+        if REPOSITORIO_TEMPLATES.atualizar():
+            self.template_menu.configure(values=self._template_keys())
+            if self.template_id_var.get() not in REPOSITORIO_TEMPLATES.snapshot():
+                self.template_id_var.set(self._template_keys()[0] if REPOSITORIO_TEMPLATES.snapshot() else "")
+        self.after(RECARREGAR_TEMPLATES_MS, self._recarregar_templates)
+
     def _add_pedido(self):
         output_pdf = self.output_pdf_var.get().strip()
         input_pdf = self.input_pdf_var.get()
+        input_verso = self.input_verso_var.get()
         template_id = self.template_id_var.get()
         texto = self.text_var.get() # Texto vazio é permitido (para não adicionar texto)
         font_override = self.font_override_var.get()
@@ -130,6 +142,9 @@ class PedidoApp(ctk.CTk):
             }
         }
 
+        if input_verso:
+            pedido_data["input_verso"] = input_verso # Verso vem de outro arquivo, não da 2ª página
+
         self.pedidos_em_lote.append(pedido_data)
         logger.info(f"Pedido adicionado ao lote: {output_pdf}")
         self.update_pedidos_list_display()
@@ -0,0 +1,364 @@
+import asyncio
+import gc
+import io
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from arquivo_saida import GravadorArquivo
+from carregador_bases import (BYTES_POR_PIXEL, carregar_pagina_cache, carregar_pagina_no_dpi, decodificador_em_processos,
+                              definir_limite_cache, devolver_memoria_ao_sistema, dpi_da_imagem, limite_cache,
+                              limpar_cache_paginas, pagina_em_cache, travas_conteudo)
+from catalogo_assets import dpi_pagina, info_base, tamanho_pagina_pixels, tamanho_pagina_pontos
+from desenho_texto import compor_sprite, render_text_sprite, restaurar_regiao
+from validacao_pedidos import chave_pedido
+
+# --- Configuração de Logging ---
+logger = logging.getLogger(__name__)
+
+ETAPAS = ("ler", "rasterizar", "desenhar", "codificar", "gravar")
+TAMANHO_FILA_PADRAO = 2 # Itens esperando entre duas etapas (limita a memória em trânsito)
+FRACAO_CACHE = 0.5 # Parte do orçamento de memória reservada ao cache de páginas decodificadas
+FATOR_PDF_CODIFICADO = 0.25 # Tamanho estimado do PDF (JPEG) em relação às páginas em RGB
+
+# --- Orçamento de Memória ---
+class OrcamentoMemoria:
+    """
+    Semáforo em bytes: cada pedido reserva sua estimativa de memória antes de entrar
+    no pipeline e devolve ao sair. Um pedido maior que o orçamento inteiro roda sozinho.
+    """
+
+    def __init__(self, total_bytes: int):
+        self.total = total_bytes
+        self.livre = total_bytes
+        self.pico = 0
+        self._condicao = asyncio.Condition()
+
+    async def reservar(self, n_bytes: int) -> int:
+        n_bytes = min(n_bytes, self.total)
+        async with self._condicao:
+            await self._condicao.wait_for(lambda: self.livre >= n_bytes)
+            self.livre -= n_bytes
+            self.pico = max(self.pico, self.total - self.livre)
+        return n_bytes
+
+    async def liberar(self, n_bytes: int):
+        async with self._condicao:
+            self.livre += n_bytes
+            self._condicao.notify_all()
+
+def estimar_memoria_pedido(paginas: list[tuple[Path, int]], catalogo: dict, dpi: int = 300) -> int:
+    """
+    Estimativa de pico por pedido: as páginas que não cabem no cache (decodificadas
+    só para este pedido), o PDF codificado em memória
+    e, durante a rasterização, a página no processo filho e os pixels em trânsito.
+    Versos saem no DPI da frente; imagens reamostradas contam a original e a cópia.
+    """
+    entradas = [(info_base(catalogo, path.name), page_number) for path, page_number in paginas]
+    dpi_saida = dpi_pagina(entradas[0][0], dpi)
+    decodificadas = [] # Bytes de cada imagem decodificada do processo filho
+    saida = [] # Bytes de cada página como vai para o PDF (já no DPI da frente)
+    for entrada, page_number in entradas:
+        if entrada.get('tipo') == 'raster':
+            largura, altura = tamanho_pagina_pixels(entrada, page_number)
+            decodificadas.append(largura * altura * BYTES_POR_PIXEL)
+            if dpi_pagina(entrada, dpi) != dpi_saida:
+                largura, altura = (round(lado * dpi_saida / 72) for lado in tamanho_pagina_pontos(entrada, page_number))
+            saida.append(largura * altura * BYTES_POR_PIXEL)
+        else:
+            largura, altura = tamanho_pagina_pixels(entrada, page_number, dpi_saida)
+            decodificadas.append(largura * altura * BYTES_POR_PIXEL)
+            saida.append(decodificadas[-1])
+
+    limite = limite_cache()
+    reamostradas = [b for b, d in zip(saida, decodificadas) if b != d]
+    fora_do_cache = sum(b for b in decodificadas + reamostradas if b > limite)
+    em_transito = 2 * max(decodificadas)
+    return fora_do_cache + int(sum(saida) * FATOR_PDF_CODIFICADO) + em_transito
+
+# --- Medição de Utilização ---
+class MedidorEtapas:
+    """Acumula o tempo ocupado de cada etapa para mostrar onde está o gargalo."""
+
+    def __init__(self, trabalhadores: dict[str, int]):
+        self.trabalhadores = trabalhadores
+        self.ocupado = {etapa: 0.0 for etapa in ETAPAS}
+        self.itens = {etapa: 0 for etapa in ETAPAS}
+        self.inicio = time.perf_counter()
+        self.fim = None
+
+    def registrar(self, etapa: str, segundos: float):
+        self.ocupado[etapa] += segundos
+        self.itens[etapa] += 1
+
+    def relatorio(self) -> dict:
+        duracao = (self.fim or time.perf_counter()) - self.inicio
+        return {
+            etapa: {
+                'itens': self.itens[etapa],
+                'ocupado_s': round(self.ocupado[etapa], 2),
+                # Fração do tempo em que os trabalhadores da etapa estiveram ocupados
+                'utilizacao': round(self.ocupado[etapa] / (duracao * self.trabalhadores[etapa]), 3) if duracao else 0.0,
+            }
+            for etapa in ETAPAS
+        }
+
+# --- Funções de Cada Etapa ---
+def _replicar_saida(origem: Path, destino: Path):
+    """Reaproveita um PDF já gerado: hardlink quando possível, cópia caso contrário."""
+    if destino == origem:
+        return
+    if destino.exists() or destino.is_symlink():
+        destino.unlink()
+    try:
+        os.link(origem, destino)
+    except OSError:
+        shutil.copy2(origem, destino)
+
+def _ler_bases(item: dict):
+    """Lê do disco os arquivos de base que ainda não estão decodificados no cache."""
+    item['dados'] = {}
+    for n, (path, page_number) in enumerate(item['paginas']):
+        # Versos saem no DPI da frente (sem catálogo, no pior caso o arquivo é lido à toa)
+        dpi = (item.get('dpi') or 300) if n else 300
+        if path not in item['dados'] and not pagina_em_cache(path, page_number, dpi):
+            item['dados'][path] = path.read_bytes()
+
+def _rasterizar(item: dict, decodificar):
+    """
+    Decodifica as páginas (via cache, em processos separados). A frente não é copiada:
+    o texto é composto direto na página cacheada e restaurado depois de codificar,
+    com as travas das páginas do pedido seguras de 'desenhar' até o fim de 'codificar'.
+    """
+    dados = item.pop('dados')
+    (path, page_number), versos = item['paginas'][0], item['paginas'][1:]
+    frente = carregar_pagina_cache(path, page_number, dados=dados.get(path), decodificar=decodificar)
+    # O PDF sai com o DPI da frente em todas as páginas: versos em PDF são rasterizados
+    # direto nesse DPI, e imagens com outro DPI são reamostradas (uma vez, via cache)
+    dpi = dpi_da_imagem(frente)
+    item['frente'] = frente
+    item['versos'] = [carregar_pagina_no_dpi(path, page_number, dpi, dados.get(path), decodificar)
+                      for path, page_number in versos]
+    item['travas'] = travas_conteudo([(path, page_number, 300)] + [(path, page_number, dpi) for path, page_number in versos])
+
+def _devolver_paginas(item: dict):
+    """Tira o texto da frente (devolvendo os pixels originais) e solta as travas das páginas."""
+    regiao = item.pop('regiao', None)
+    if regiao:
+        restaurar_regiao(item['frente'], regiao)
+    for trava in item.pop('travadas', []):
+        trava.release()
+
+def _desenhar(item: dict, templates: dict):
+    frente = item['pedido']['pagina_frente']
+    config = templates[frente['template_imagem']]
+    sprite = render_text_sprite(config, frente['texto'], frente.get('fonte'))
+    # Sempre na mesma ordem (travas_conteudo): dois pedidos com as mesmas páginas não se travam
+    item['travadas'] = []
+    for trava in item['travas']:
+        trava.acquire()
+        item['travadas'].append(trava)
+    # Verso que é a própria frente não pode sair com o texto (a cópia é feita já com a trava)
+    item['versos'] = [img.copy() if img is item['frente'] else img for img in item['versos']]
+    if sprite:
+        item['regiao'] = compor_sprite(item['frente'], *sprite)
+
+def _codificar(item: dict):
+    img_frente = item['frente']
+    buffer = io.BytesIO()
+    try:
+        img_frente.save(
+            buffer,
+            "PDF",
+            resolution=dpi_da_imagem(img_frente), # Mantém a resolução alta (os versos já estão nesse DPI)
+            save_all=True,
+            append_images=item['versos'] # Anexa a página traseira
+        )
+    finally:
+        _devolver_paginas(item) # A frente é a página do cache: restaura antes de outro pedido usá-la
+    del item['frente'], item['versos']
+    item['pdf'] = buffer.getvalue()
+    buffer.close()
+
+def _gravar(item: dict):
+    """Grava o PDF de forma atômica (temporário + rename) e replica para pedidos idênticos."""
+    destino: Path = item['saida']
+    # Temporário com nome único: no modo distribuído, um shard retomado pode estar
+    # sendo gravado ao mesmo tempo por dois trabalhadores (em máquinas diferentes)
+    tmp_path = destino.with_name(f"{destino.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(item.pop('pdf'))
+    os.replace(tmp_path, destino)
+    for replica in item['replicas']:
+        _replicar_saida(destino, replica)
+
+def _gravar_no_arquivo(item: dict, arquivo: GravadorArquivo):
+    """Acrescenta o PDF ao arquivo ZIP/tar, uma vez por nome de saída (pedidos idênticos incluídos)."""
+    nomes = [item['saida'].name] + [replica.name for replica in item['replicas']]
+    item['gravado_em'] = arquivo.adicionar(item['saida'].name, item.pop('pdf'), nomes)
+
+# --- Motor ---
+async def executar_pipeline(pedidos_validos: list[tuple[int, dict, list]], templates: dict, output_dir: Path,
+                            trabalhadores_cpu: int | None = None, tamanho_fila: int = TAMANHO_FILA_PADRAO,
+                            orcamento_bytes: int | None = None, catalogo: dict | None = None,
+                            arquivo: GravadorArquivo | None = None) -> dict:
+    """
+    Renderiza os pedidos em um pipeline de etapas com filas limitadas entre elas:
+    ler (I/O assíncrono) -> rasterizar (processos) -> desenhar -> codificar (CPU, em threads) -> gravar (I/O assíncrono).
+    A rasterização roda em processos porque o MuPDF não é thread-safe; o PIL (composição
+    e JPEG) solta o GIL nas partes pesadas, então as demais etapas de CPU ficam em threads.
+    As filas limitadas dão backpressure: uma etapa lenta segura as anteriores, então
+    a memória em trânsito fica limitada a ~(tamanho_fila + trabalhadores) páginas por etapa.
+
+    Com 'orcamento_bytes' (exige 'catalogo'), a memória é limitada de fato: parte vai
+    para o cache de páginas, e cada pedido reserva sua estimativa do restante antes de
+    entrar no pipeline. O número de trabalhadores de CPU também é reduzido para caber.
+    Com 'arquivo', os PDFs vão direto para o ZIP/tar em vez de arquivos soltos em output_dir
+    (quem cria o gravador é quem o fecha).
+    Retorna {'sucesso', 'falhas', 'utilizacao', 'memoria'}.
+    """
+    trabalhadores_cpu = trabalhadores_cpu or os.cpu_count() or 1
+    resultado = {'sucesso': 0, 'falhas': 0}
+
+    # Pedidos idênticos viram um só item; os demais nomes são replicados na gravação
+    itens: dict[tuple, dict] = {}
+    for i, pedido, paginas in pedidos_validos:
+        saida = output_dir / pedido['output_pdf']
+        chave = chave_pedido(pedido) or ('__unico__', i)
+        if chave in itens:
+            itens[chave]['replicas'].append(saida)
+        else:
+            itens[chave] = {'indice': i, 'pedido': pedido, 'paginas': paginas, 'saida': saida, 'replicas': [], 'memoria': 0}
+            if catalogo:
+                itens[chave]['dpi'] = dpi_pagina(info_base(catalogo, paginas[0][0].name))
+
+    orcamento = None
+    if orcamento_bytes:
+        definir_limite_cache(int(orcamento_bytes * FRACAO_CACHE))
+        orcamento = OrcamentoMemoria(orcamento_bytes - limite_cache())
+        for item in itens.values():
+            item['memoria'] = estimar_memoria_pedido(item['paginas'], catalogo)
+        maior = max((item['memoria'] for item in itens.values()), default=0)
+        if maior > orcamento.total:
+            logger.warning(f"Pedido estimado em {maior / 2**20:.0f} MB excede o orçamento de pedidos "
+                           f"({orcamento.total / 2**20:.0f} MB); pedidos assim rodarão sozinhos.")
+        if maior:
+            trabalhadores_cpu = max(1, min(trabalhadores_cpu, orcamento.total // maior))
+        logger.info(f"Orçamento de memória: {orcamento_bytes / 2**20:.0f} MB "
+                    f"(cache {limite_cache() / 2**20:.0f} MB, pedidos {orcamento.total / 2**20:.0f} MB; "
+                    f"maior pedido ~{maior / 2**20:.0f} MB) -> {trabalhadores_cpu} trabalhadores de CPU.")
+
+    trabalhadores = {"ler": 1, "rasterizar": trabalhadores_cpu, "desenhar": 1, "codificar": trabalhadores_cpu, "gravar": 1}
+    medidor = MedidorEtapas(trabalhadores)
+
+    filas = [asyncio.Queue(maxsize=tamanho_fila) for _ in ETAPAS]
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=trabalhadores_cpu * 2 + 1, thread_name_prefix="pipeline")
+    # 'spawn' e não 'fork': o processo principal já tem threads (fork com threads pode travar)
+    processos = ProcessPoolExecutor(max_workers=trabalhadores_cpu, mp_context=multiprocessing.get_context("spawn"))
+    decodificar = decodificador_em_processos(processos)
+
+    funcoes = {
+        "ler": _ler_bases,
+        "rasterizar": lambda item: _rasterizar(item, decodificar),
+        "desenhar": lambda item: _desenhar(item, templates),
+        "codificar": _codificar,
+        "gravar": (lambda item: _gravar_no_arquivo(item, arquivo)) if arquivo else _gravar,
+    }
+
+    async def executar_etapa(etapa: str, item: dict):
+        inicio = time.perf_counter()
+        try:
+            if etapa in ("ler", "gravar"):
+                await asyncio.to_thread(funcoes[etapa], item)
+            else:
+                await loop.run_in_executor(executor, funcoes[etapa], item)
+        finally:
+            medidor.registrar(etapa, time.perf_counter() - inicio)
+
+    async def finalizar(item: dict):
+        """Item saiu do pipeline (pronto ou com falha): solta buffers e devolve o orçamento."""
+        _devolver_paginas(item) # Falha entre 'desenhar' e 'codificar': a frente ainda tem o texto
+        for chave in ('dados', 'frente', 'versos', 'pdf'):
+            item.pop(chave, None)
+        if orcamento:
+            # O PdfImagePlugin do PIL deixa cada página anexada num ciclo de referências
+            # (page.encoderinfo['append_images'] contém a própria página); sem coletar,
+            # páginas fora do cache (centenas de MB) só seriam liberadas bem mais tarde
+            gc.collect()
+            devolver_memoria_ao_sistema()
+            if item['memoria']:
+                await orcamento.liberar(item['memoria'])
+
+    async def trabalhador(indice_etapa: int):
+        etapa = ETAPAS[indice_etapa]
+        entrada = filas[indice_etapa]
+        saida = filas[indice_etapa + 1] if indice_etapa + 1 < len(ETAPAS) else None
+        while True:
+            item = await entrada.get()
+            try:
+                if item is None:
+                    return
+                await executar_etapa(etapa, item)
+                if saida is not None:
+                    await saida.put(item)
+                    continue
+                resultado['sucesso'] += 1 + len(item['replicas'])
+                logger.info(f"SUCESSO: PDF '{item['saida'].name}' salvo em {item.get('gravado_em', item['saida'])}"
+                            + (f" (+{len(item['replicas'])} idênticos reaproveitados)" if item['replicas'] else ""))
+                await finalizar(item)
+            except Exception as e:
+                resultado['falhas'] += 1 + len(item['replicas'])
+                logger.error(f"FALHA ao processar '{item['pedido']['output_pdf']}' (etapa '{etapa}'): {e}")
+                await finalizar(item)
+            finally:
+                entrada.task_done()
+
+    tarefas_por_etapa = [
+        [asyncio.create_task(trabalhador(n)) for _ in range(trabalhadores[etapa])]
+        for n, etapa in enumerate(ETAPAS)
+    ]
+
+    try:
+        for item in itens.values():
+            if orcamento:
+                # Espera até haver memória para o pedido (a reserva pode ser ajustada ao total)
+                item['memoria'] = await orcamento.reservar(item['memoria'])
+            await filas[0].put(item) # Bloqueia quando o pipeline está cheio (backpressure)
+
+        # Encerra etapa por etapa: cada uma só recebe o sinal de fim depois de esvaziar
+        for n, tarefas in enumerate(tarefas_por_etapa):
+            for _ in tarefas:
+                await filas[n].put(None)
+            await asyncio.gather(*tarefas)
+    finally:
+        medidor.fim = time.perf_counter()
+        executor.shutdown(wait=True)
+        processos.shutdown(wait=True)
+        limpar_cache_paginas()
+        if orcamento:
+            definir_limite_cache()
+
+    resultado['utilizacao'] = medidor.relatorio()
+    resultado['memoria'] = {
+        'orcamento_mb': round(orcamento_bytes / 2**20) if orcamento_bytes else None,
+        'pico_reservado_mb': round(orcamento.pico / 2**20) if orcamento else None,
+        'trabalhadores_cpu': trabalhadores_cpu,
+    }
+    return resultado
+
+def registrar_utilizacao(utilizacao: dict):
+    """Escreve no log a utilização de cada etapa; a mais ocupada é o gargalo."""
+    gargalo = max(utilizacao, key=lambda etapa: utilizacao[etapa]['utilizacao'])
+    for etapa, dados in utilizacao.items():
+        marca = "  <- gargalo" if etapa == gargalo else ""
+        logger.info(f"  Etapa {etapa:<11} {dados['itens']:>5} itens, {dados['ocupado_s']:>8.2f}s ocupada, "
+                    f"utilização {dados['utilizacao']:.0%}{marca}")
+
+def rodar_pipeline(pedidos_validos: list[tuple[int, dict, list]], templates: dict, output_dir: Path, **kwargs) -> dict:
+    """Versão síncrona de executar_pipeline (para chamar do script principal)."""
+    return asyncio.run(executar_pipeline(pedidos_validos, templates, output_dir, **kwargs))
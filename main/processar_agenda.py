@@ -1,12 +1,15 @@
 
+import argparse
 import logging
 import json
-import textwrap
 import time
-import shutil
 from pathlib import Path
-from PIL import Image, ImageDraw, ImageFont
-import fitz # PyMuPDF
+from arquivo_saida import FORMATOS_ARQUIVO, GravadorArquivo
+from catalogo_assets import atualizar_catalogo
+from fila_distribuida import LEASE_SEGUNDOS_PADRAO, SHARDS_PADRAO, consolidar_resultados, executar_trabalhador, preparar_execucao
+from motor_pipeline import registrar_utilizacao, rodar_pipeline
+from repositorio_templates import RepositorioTemplates
+from validacao_pedidos import registrar_relatorio, validar_pedidos
 
 # --- Configuração de Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,262 +18,174 @@ logger = logging.getLogger(__name__)
 # --- Definição de Caminhos (Paths) ---
 BASE_DIR = Path(__file__).parent
 FONT_DIR = BASE_DIR / "fonts"
-PICTURE_DIR = BASE_DIR / "pictures" # PDFs de entrada (input_pdf_base) devem estar aqui
+PICTURE_DIR = BASE_DIR / "pictures" # Bases de entrada (PDF ou JPG/PNG) devem estar aqui
 OUTPUT_DIR = BASE_DIR / "output"
-TEMP_DIR = BASE_DIR / "temp_pdf_extract" # Pasta temporária
-TEMPLATE_CONFIG_FILE = BASE_DIR / "templates.json"
 PEDIDOS_FILE = BASE_DIR / "pedidos_pdf_duas_paginas.json" # O JSON correto
 
 # Garante que os diretórios existem
 OUTPUT_DIR.mkdir(exist_ok=True)
-TEMP_DIR.mkdir(exist_ok=True) # Cria a pasta temporária
 
-# --- Carregar Configuração de Templates ---
-try:
-    with open(TEMPLATE_CONFIG_FILE, 'r', encoding='utf-8') as f:
-        TEMPLATES_CONFIG = json.load(f)
-    logger.info(f"Carregados {len(TEMPLATES_CONFIG)} templates de '{TEMPLATE_CONFIG_FILE}'")
-except Exception as e:
-    logger.critical(f"ERRO CRÍTICO ao carregar 'templates.json': {e}")
-    TEMPLATES_CONFIG = {}
+# --- Repositório de Templates ---
+# Um arquivo por template; cada lote (ou shard) relê só os templates alterados
+REPOSITORIO_TEMPLATES = RepositorioTemplates()
 
-# --- Funções Helper de Desenho (Copiadas do script antigo) ---
-GLOBAL_DEFAULT_FONT = "sao.ttf" # Mude para sua fonte padrão
-
-def get_font_line_height(font: ImageFont.FreeTypeFont) -> float:
+# --- Função Principal de Processamento ---
+def versoes_dos_assets(catalogo: dict) -> dict:
+    """Conteúdo dos assets que um lote usa: entra no id da execução distribuída."""
+    REPOSITORIO_TEMPLATES.atualizar(forcar=True)
+    return {
+        'bases': {nome: entrada['sha256'] for nome, entrada in catalogo['bases'].items()},
+        'fontes': {nome: entrada['sha256'] for nome, entrada in catalogo['fontes'].items()},
+        'templates': dict(REPOSITORIO_TEMPLATES.snapshot()),
+    }
+
+def carregar_pedidos() -> list[dict] | None:
     try:
-        bbox = font.getbbox("Aghy")
-        return (bbox[3] - bbox[1]) * 1.25
-    except AttributeError:
-        # Fallback
-        mask = font.getmask("hg")
-        return mask.size[1] * 1.25
-
-def draw_templated_text(draw: ImageDraw.ImageDraw, config: dict, text_input: str, font_override: str | None = None):
-    font_name_to_use = GLOBAL_DEFAULT_FONT
-    if config.get('font_name'):
-        font_name_to_use = config['font_name']
-    if font_override:
-        font_name_to_use = font_override
-        
-    font_path = FONT_DIR / font_name_to_use
-    
-    if not font_path.exists():
-        logger.warning(f"Fonte '{font_name_to_use}' não encontrada. Usando fallback '{GLOBAL_DEFAULT_FONT}'.")
-        font_path = FONT_DIR / GLOBAL_DEFAULT_FONT
-        if not font_path.exists():
-            raise FileNotFoundError(f"Fonte de fallback '{GLOBAL_DEFAULT_FONT}' não encontrada em {FONT_DIR}")
-
-    font_size = config.get('font_size', 50)
-    font = ImageFont.truetype(str(font_path), font_size)
-    
-    fill = config.get('color', '#000000')
-    align = config.get('align', 'left')
-    
-    max_pixel_width = config.get('max_width_pixels', 9999) 
-    lines = []
-    words = text_input.split()
-    current_line = ""
-
-    for word in words:
-        test_line = f"{current_line} {word}".strip()
-        try:
-            line_bbox = draw.textbbox((0,0), test_line, font=font)
-            line_width = line_bbox[2] - line_bbox[0]
-        except AttributeError:
-            line_width = font.getlength(test_line)
-
-        if line_width <= max_pixel_width:
-            current_line = test_line
-        else:
-            lines.append(current_line)
-            current_line = word
-            
-    lines.append(current_line)
-    
-    if 'max_lines' in config:
-        lines = lines[:config['max_lines']]
-
-    current_y = config.get('pos_y', 10) 
-    line_height = get_font_line_height(font)
+        with open(PEDIDOS_FILE, mode='r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.critical(f"ERRO: Arquivo de pedidos '{PEDIDOS_FILE}' não encontrado.")
+    except json.JSONDecodeError:
+        logger.critical(f"ERRO: O arquivo '{PEDIDOS_FILE}' contém um JSON inválido (o // não é permitido).")
+    return None
 
-    for line in lines:
-        try:
-            line_bbox = draw.textbbox((0, 0), line, font=font)
-            line_width = line_bbox[2] - line_bbox[0]
-            line_top_offset = line_bbox[1]
-        except AttributeError:
-            try:
-                bbox = font.getbbox(line)
-                line_width = bbox[2] - bbox[0]
-                line_top_offset = bbox[1]
-            except AttributeError:
-                mask = font.getmask(line)
-                line_width, _ = mask.size
-                line_top_offset = 0
-        
-        draw_x = config.get('pos_x', 10) 
-        
-        if align == "center":
-            draw_x = config.get('pos_x', 10) + (max_pixel_width / 2) - (line_width / 2)
-        elif align == "right":
-            draw_x = config.get('pos_x', 10) + max_pixel_width - line_width
-        
-        draw.text(
-            (draw_x, current_y - line_top_offset), 
-            line, 
-            font=font, 
-            fill=fill
-        )
-        current_y += line_height
-        
-# --- Funções de Extração de PDF ---
-def extrair_pagina_pdf_para_png(pdf_path: Path, page_number: int, output_png_path: Path, dpi: int = 300):
+def processar_lote(pedidos: list[dict], catalogo: dict, somente_validar: bool = False,
+                   trabalhadores: int | None = None, memoria_mb: int | None = None,
+                   formato_arquivo: str | None = None, volume_mb: int | None = None, nome_arquivo: str = "lote") -> dict:
     """
-    Extrai uma página específica de um PDF e a salva como PNG.
-    page_number é 0-based (0 para a primeira página).
+    Valida os pedidos (pré-passo sem renderização) e renderiza os válidos pelo motor
+    em pipeline. Com formato_arquivo ('zip' ou 'tar'), os PDFs vão direto para
+    '<nome_arquivo>.zip' em OUTPUT_DIR (em volumes de até volume_mb, se informado),
+    com um índice pedido -> membro + SHA-256. Retorna {'relatorio', 'sucesso', 'falhas'}.
     """
-    doc = None
+    # Snapshot dos templates para o lote inteiro: edições feitas durante a renderização
+    # valem a partir do próximo lote/shard, sem misturar versões dentro de um lote
+    alterados = REPOSITORIO_TEMPLATES.atualizar()
+    if alterados:
+        logger.info(f"Templates recarregados: {', '.join(sorted(alterados))}")
+    templates = REPOSITORIO_TEMPLATES.snapshot()
+    logger.info(f"Usando {len(templates)} templates de '{REPOSITORIO_TEMPLATES.pasta}'")
+
+    # Pré-passo: referências + medição do texto, sem rasterizar nenhuma página
+    pedidos_validos, relatorio = validar_pedidos(pedidos, catalogo, templates)
+    registrar_relatorio(relatorio)
+    if somente_validar:
+        return {'relatorio': relatorio, 'sucesso': 0, 'falhas': 0}
+
+    logger.info(f"Iniciando renderização de {len(pedidos_validos)} pedidos válidos...")
+
+    # Um gravador por lote (ou shard); é fechado aqui mesmo se o pipeline falhar, para o índice sair
+    arquivo = None
+    if formato_arquivo:
+        arquivo = GravadorArquivo(OUTPUT_DIR, nome_arquivo, formato_arquivo, volume_mb * 2**20 if volume_mb else None)
     try:
-        doc = fitz.open(pdf_path)
-        if page_number >= len(doc):
-            raise IndexError(f"PDF tem apenas {len(doc)} páginas. Não foi possível extrair a página {page_number + 1}.")
-            
-        page: fitz.Page = doc[page_number]
-        
-        # Define a matriz de renderização para DPI
-        mat = fitz.Matrix(dpi / 72, dpi / 72)
-        pix = page.get_pixmap(matrix=mat)
-        
-        pix.save(str(output_png_path))
-        logger.debug(f"Página {page_number + 1} de '{pdf_path.name}' extraída para '{output_png_path.name}'")
-        return output_png_path
-    except Exception as e:
-        logger.error(f"Erro ao extrair página {page_number + 1} de '{pdf_path.name}': {e}")
-        return None
+        resultado = rodar_pipeline(pedidos_validos, templates, OUTPUT_DIR, trabalhadores_cpu=trabalhadores,
+                                   orcamento_bytes=memoria_mb * 2**20 if memoria_mb else None, catalogo=catalogo,
+                                   arquivo=arquivo)
     finally:
-        if doc:
-            doc.close()
+        if arquivo:
+            indice_path = arquivo.fechar()
+            if indice_path:
+                logger.info(f"{len(arquivo.volumes)} volume(s) {formato_arquivo} gravados; índice em '{indice_path}'.")
 
-# --- Função Principal de Processamento ---
-def processar_pedidos_pdf_duas_paginas():
+    logging.info("Utilização das etapas do pipeline:")
+    registrar_utilizacao(resultado['utilizacao'])
+    return {'relatorio': relatorio, 'sucesso': resultado['sucesso'], 'falhas': len(pedidos) - resultado['sucesso']}
+
+def processar_pedidos_pdf_duas_paginas(somente_validar: bool = False, trabalhadores: int | None = None, memoria_mb: int | None = None,
+                                       formato_arquivo: str | None = None, volume_mb: int | None = None):
     """
-    Lê o 'pedidos_pdf_duas_paginas.json', extrai páginas de PDFs de entrada,
-    modifica a frente e junta em novos PDFs.
+    Lê o 'pedidos_pdf_duas_paginas.json', valida o lote inteiro (pré-passo sem
+    renderização), decodifica as páginas das bases de entrada (PDFs ou imagens),
+    modifica a frente e junta em novos PDFs. Só os pedidos válidos são renderizados,
+    pelo motor em pipeline (motor_pipeline.py).
+    Com somente_validar=True, para depois do pré-passo (dry-run).
+    Com memoria_mb, o motor respeita esse orçamento de memória (cache + pedidos em voo).
     """
-    
-    try:
-        with open(PEDIDOS_FILE, mode='r', encoding='utf-8') as f:
-            pedidos_para_processar = json.load(f)
-    except FileNotFoundError:
-        logger.critical(f"ERRO: Arquivo de pedidos '{PEDIDOS_FILE}' não encontrado.")
-        return
-    except json.JSONDecodeError:
-        logger.critical(f"ERRO: O arquivo '{PEDIDOS_FILE}' contém um JSON inválido (o // não é permitido).")
+    pedidos_para_processar = carregar_pedidos()
+    if pedidos_para_processar is None:
         return
 
     total_pedidos = len(pedidos_para_processar)
-    sucesso_pedidos = 0
-    logger.info(f"Encontrados {total_pedidos} pedidos em '{PEDIDOS_FILE}'. Iniciando processamento...")
-
-    # Limpa a pasta temporária no início
-    shutil.rmtree(TEMP_DIR, ignore_errors=True)
-    TEMP_DIR.mkdir(exist_ok=True)
-    logger.info(f"Pasta temporária '{TEMP_DIR.name}' limpa.")
+    logger.info(f"Encontrados {total_pedidos} pedidos em '{PEDIDOS_FILE}'. Validando...")
 
-    for i, pedido in enumerate(pedidos_para_processar):
-        output_pdf_name = pedido.get('output_pdf')
-        input_pdf_base_name = pedido.get('input_pdf_base')
-        pagina_frente_config = pedido.get('pagina_frente')
-        
-        if not output_pdf_name or not input_pdf_base_name or not pagina_frente_config:
-            logger.warning(f"Pulando pedido {i+1} (JSON mal formatado: 'output_pdf', 'input_pdf_base' ou 'pagina_frente' faltando).")
-            continue
-            
-        logger.info(f"Processando Pedido {i+1}/{total_pedidos}: '{output_pdf_name}' (Base: {input_pdf_base_name})...")
-        
-        input_pdf_path = PICTURE_DIR / input_pdf_base_name
-        if not input_pdf_path.exists():
-            logger.error(f"  -> ERRO: PDF de entrada '{input_pdf_base_name}' não encontrado em '{PICTURE_DIR}'.")
-            continue
+    # Catálogo de assets: valida as bases sem abri-las a cada pedido
+    catalogo = atualizar_catalogo()
 
-        temp_front_png = TEMP_DIR / f"temp_{i}_front.png"
-        temp_back_png = TEMP_DIR / f"temp_{i}_back.png"
-        
-        try:
-            # 1. Extrair a primeira página (frente)
-            extracted_front_path = extrair_pagina_pdf_para_png(input_pdf_path, 0, temp_front_png)
-            if not extracted_front_path:
-                raise Exception("Falha ao extrair página da frente.")
+    resultado = processar_lote(pedidos_para_processar, catalogo, somente_validar, trabalhadores, memoria_mb,
+                               formato_arquivo, volume_mb)
+    if somente_validar:
+        return resultado['relatorio']
 
-            # 2. Extrair a segunda página (traseira)
-            extracted_back_path = extrair_pagina_pdf_para_png(input_pdf_path, 1, temp_back_png)
-            if not extracted_back_path:
-                raise Exception("Falha ao extrair página de trás.")
-            
-            # 3. Aplicar o texto à página da frente
-            template_name = pagina_frente_config.get('template_imagem')
-            texto_frente = pagina_frente_config.get('texto')
-            fonte_override_frente = pagina_frente_config.get('fonte')
+    logging.info("--- Processamento em Lote Concluído ---")
+    logging.info(f"Total de pedidos PDF processados: {total_pedidos}")
+    logging.info(f"Gerados com sucesso: {resultado['sucesso']}")
+    logging.info(f"Pedidos com falha: {resultado['falhas']}")
+    return resultado['relatorio']
 
-            if not template_name or texto_frente is None:
-                logger.error(f"  -> ERRO: Configuração incompleta para a página da frente do PDF '{output_pdf_name}'.")
-                raise Exception("Configuração de página da frente incompleta.")
-            
-            if template_name not in TEMPLATES_CONFIG:
-                logger.error(f"  -> ERRO: Template '{template_name}' não encontrado em templates.json para a página da frente.")
-                raise FileNotFoundError(f"Template '{template_name}' não definido.")
-            
-            config = TEMPLATES_CONFIG[template_name]
-            
-            img_frente = Image.open(extracted_front_path)
-            img_frente = img_frente.convert("RGBA") # Converte para RGBA para desenhar
-            draw = ImageDraw.Draw(img_frente)
-            
-            draw_templated_text(draw, config, texto_frente, fonte_override_frente)
-            
-            # Converte de volta para RGB para salvar em PDF
-            img_frente_modificada = img_frente.convert("RGB")
-            logger.info(f"  -> Página da frente de '{output_pdf_name}' modificada com texto.")
+def processar_distribuido(fila_dir: Path, n_shards: int = SHARDS_PADRAO, trabalhador: str | None = None,
+                          lease_segundos: float = LEASE_SEGUNDOS_PADRAO, trabalhadores: int | None = None,
+                          memoria_mb: int | None = None, formato_arquivo: str | None = None, volume_mb: int | None = None):
+    """
+    Modo distribuído: rode este mesmo comando em várias máquinas com a mesma 'fila_dir'
+    (pasta compartilhada). O lote é dividido em shards determinísticos; cada processo
+    pega shards livres por lease, e shards de trabalhadores que caíram são retomados.
+    Ao final, qualquer trabalhador consolida o relatório único da execução.
+    Com formato_arquivo, cada shard grava seu próprio arquivo ('lote-shard-0007.zip').
+    """
+    pedidos_para_processar = carregar_pedidos()
+    if pedidos_para_processar is None:
+        return
 
-            # 4. Carregar a página traseira inalterada
-            img_traseira = Image.open(extracted_back_path)
-            img_traseira_rgb = img_traseira.convert("RGB") # Garante RGB
-            logger.info(f"  -> Página traseira de '{output_pdf_name}' carregada (inalterada).")
+    catalogo = atualizar_catalogo()
+    # Assets alterados (base corrigida, template editado) = execução nova, não o relatório antigo
+    exec_dir = preparar_execucao(fila_dir, pedidos_para_processar, n_shards, versoes_dos_assets(catalogo))
 
-            # 5. Juntar as duas imagens em um novo PDF
-            output_pdf_path = OUTPUT_DIR / output_pdf_name
-            
-            img_frente_modificada.save(
-                output_pdf_path,
-                "PDF",
-                resolution=300.0, # Mantém a resolução alta
-                save_all=True,
-                append_images=[img_traseira_rgb] # Anexa a página traseira
-            )
-            
-            logger.info(f"SUCESSO: PDF '{output_pdf_name}' salvo em {output_pdf_path}")
-            sucesso_pedidos += 1
+    def processar_shard(nome: str, itens: list[tuple[int, dict]]) -> dict:
+        return processar_lote([pedido for _, pedido in itens], catalogo, trabalhadores=trabalhadores, memoria_mb=memoria_mb,
+                              formato_arquivo=formato_arquivo, volume_mb=volume_mb, nome_arquivo=f"lote-{nome}")
 
-        except Exception as e:
-            logger.error(f"FALHA ao processar '{output_pdf_name}': {e}")
-        finally:
-            # Limpa os arquivos PNG temporários
-            if temp_front_png.exists(): temp_front_png.unlink()
-            if temp_back_png.exists(): temp_back_png.unlink()
-            logger.debug(f"Arquivos temporários para '{output_pdf_name}' limpos.")
+    executar_trabalhador(exec_dir, processar_shard, trabalhador, lease_segundos)
+    relatorio = consolidar_resultados(exec_dir)
 
-    # Limpa a pasta temporária no final
-    shutil.rmtree(TEMP_DIR, ignore_errors=True)
-    
-    logging.info("--- Processamento em Lote Concluído ---")
-    logging.info(f"Total de pedidos PDF processados: {total_pedidos}")
-    logging.info(f"Gerados com sucesso: {sucesso_pedidos}")
-    logging.info(f"Pedidos com falha: {total_pedidos - sucesso_pedidos}")
+    logging.info(f"--- Execução Distribuída '{relatorio['execucao']}' Concluída ---")
+    for nome, dados in relatorio['por_trabalhador'].items():
+        logging.info(f"  Trabalhador {nome}: {dados['shards']} shards, {dados['pedidos']} pedidos, {dados['ocupado_s']:.2f}s")
+    logging.info(f"Total de pedidos PDF processados: {relatorio['total']}")
+    logging.info(f"Gerados com sucesso: {relatorio['sucesso']}")
+    logging.info(f"Pedidos com falha: {relatorio['falhas']}")
+    logging.info(f"Relatório consolidado em '{exec_dir / 'relatorio.json'}'.")
+    return relatorio
 
 # --- Ponto de Entrada Principal ---
+def _inteiro_positivo(valor: str) -> int:
+    try:
+        n = int(valor)
+    except ValueError:
+        n = 0
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"deve ser um inteiro >= 1 (recebido: {valor})")
+    return n
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Processa o lote de pedidos PDF de duas páginas.")
+    parser.add_argument("--validar", action="store_true", help="Só roda o pré-passo de validação e estimativa de custo (dry-run).")
+    parser.add_argument("--trabalhadores", type=int, default=None, help="Trabalhadores por etapa de CPU do pipeline (padrão: nº de CPUs).")
+    parser.add_argument("--memoria-mb", type=int, default=None, help="Orçamento de memória do motor, em MB (para alta resolução e muitos trabalhadores).")
+    parser.add_argument("--fila", type=Path, default=None, help="Pasta compartilhada da execução distribuída (rode o mesmo comando em várias máquinas).")
+    parser.add_argument("--shards", type=_inteiro_positivo, default=SHARDS_PADRAO, help="Nº de shards do lote no modo distribuído (igual em todas as máquinas).")
+    parser.add_argument("--trabalhador-id", default=None, help="Nome deste trabalhador no modo distribuído (padrão: host-pid).")
+    parser.add_argument("--lease-segundos", type=float, default=LEASE_SEGUNDOS_PADRAO, help="Validade do lease sem heartbeat antes de outro trabalhador retomar o shard.")
+    parser.add_argument("--arquivo", choices=FORMATOS_ARQUIVO, default=None, help="Grava os PDFs direto num arquivo ZIP/tar (com índice), em vez de PDFs soltos.")
+    parser.add_argument("--volume-mb", type=int, default=None, help="Divide o arquivo em volumes de até este tamanho, em MB.")
+    args = parser.parse_args()
+
     start_time = time.time()
-    processar_pedidos_pdf_duas_paginas()
+    if args.fila:
+        processar_distribuido(args.fila, args.shards, args.trabalhador_id, args.lease_segundos, args.trabalhadores, args.memoria_mb,
+                              args.arquivo, args.volume_mb)
+    else:
+        processar_pedidos_pdf_duas_paginas(somente_validar=args.validar, trabalhadores=args.trabalhadores, memoria_mb=args.memoria_mb,
+                                           formato_arquivo=args.arquivo, volume_mb=args.volume_mb)
     end_time = time.time()
-    logger.info(f"Tempo total de execução: {end_time - start_time:.2f} segundos.")
\ No newline at end of file
+    logger.info(f"Tempo total de execução: {end_time - start_time:.2f} segundos.")
@@ -0,0 +1,274 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from types import MappingProxyType
+from urllib.parse import quote, unquote
+
+# --- Configuração de Logging ---
+logger = logging.getLogger(__name__)
+
+# --- Definição de Caminhos ---
+BASE_DIR = Path(__file__).parent
+TEMPLATES_DIR = BASE_DIR / "templates" # Um arquivo por template: templates/<id>.json
+TEMPLATES_JSON_LEGADO = BASE_DIR / "templates.json" # Formato antigo (um arquivo com todos)
+
+INTERVALO_VERIFICACAO = 1.0 # Segundos mínimos entre duas varreduras da pasta
+TRAVA_TIMEOUT = 10.0 # Trava de escrita mais velha que isso é de um processo que caiu
+
+class ConflitoVersao(Exception):
+    """O template foi salvo por outro processo desde que foi lido."""
+
+def nome_arquivo(template_id: str) -> str:
+    """
+    Nome do arquivo de um template. Qualquer ID é aceito (o editor antigo não
+    restringia): o que não for letra, número, espaço, '-', '_' ou '.' vira %XX,
+    e o caminho inverso (unquote) devolve o ID original.
+    """
+    if not template_id:
+        raise ValueError("ID de template vazio.")
+    nome = "".join(c if c.isalnum() or c in " -_." else quote(c, safe="") for c in template_id)
+    if nome.startswith('.'): # Não gera arquivo oculto nem '..'
+        nome = "%2E" + nome[1:]
+    return nome + ".json"
+
+def id_do_arquivo(nome: str) -> str:
+    return unquote(nome[:-len('.json')])
+
+def _caminho(pasta: Path, template_id: str) -> Path:
+    return pasta / nome_arquivo(template_id)
+
+def _gravar_arquivo(path: Path, versao: int, config: dict):
+    """Temporário + rename atômico: quem lê nunca vê um template pela metade."""
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'versao': versao, 'salvo_em': time.time(), 'config': config}, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _assinatura(st: os.stat_result) -> tuple:
+    # O rename atômico troca o inode; mtime/tamanho cobrem edições feitas à mão no arquivo
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def _ler_arquivo(path: Path) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        dados = json.load(f)
+    if 'config' not in dados: # Arquivo escrito à mão só com a config
+        dados = {'versao': 0, 'config': dados}
+    return dados
+
+class RepositorioTemplates:
+    """
+    Templates com um arquivo por template, escrita atômica e número de versão.
+    - Leitura sem trava: snapshot() devolve um mapeamento imutável que é trocado
+      inteiro (uma atribuição) quando algo muda. Quem está renderizando continua
+      com o snapshot que pegou; não há trava no caminho quente.
+    - atualizar() varre a pasta (só stat) e relê apenas os arquivos que mudaram.
+      Processos longos chamam antes de cada lote para pegar edições sem reiniciar.
+    - salvar() grava um template só, com checagem de versão: duas pessoas editando
+      templates diferentes não se sobrescrevem, e a mesma edição concorrente vira erro.
+    As configs do snapshot são compartilhadas: não altere, copie antes.
+    """
+
+    def __init__(self, pasta: Path = TEMPLATES_DIR, legado: Path | None = TEMPLATES_JSON_LEGADO,
+                 intervalo_verificacao: float = INTERVALO_VERIFICACAO):
+        # 'legado' só serve para avisar de um templates.json ainda não migrado;
+        # a migração é explícita (migrar_templates_json), nunca um efeito de importar
+        self.pasta = Path(pasta)
+        self.intervalo_verificacao = intervalo_verificacao
+        self._entradas: dict[str, tuple[tuple, int, dict]] = {} # id -> (assinatura, versão, config)
+        self._snapshot = MappingProxyType({})
+        self._trava_atualizacao = threading.Lock() # Só entre quem atualiza; leitores não usam
+        self._ultima_verificacao = 0.0
+        self.atualizar(forcar=True)
+        if legado is not None and not self._snapshot and _tem_conteudo(Path(legado)):
+            logger.warning(f"Nenhum template em '{self.pasta}', mas '{Path(legado).name}' tem templates. "
+                           f"Migre com: python repositorio_templates.py --migrar")
+
+    # --- Leitura ---
+    def snapshot(self) -> MappingProxyType:
+        """Templates atuais {id: config}, sem trava e sem ir ao disco."""
+        return self._snapshot
+
+    def versao(self, template_id: str) -> int | None:
+        entrada = self._entradas.get(template_id)
+        return entrada[1] if entrada else None
+
+    def atualizar(self, forcar: bool = False) -> set[str]:
+        """
+        Relê só o que mudou desde a última varredura (no máximo uma a cada
+        'intervalo_verificacao' segundos, salvo 'forcar'). Retorna os IDs alterados,
+        novos ou removidos.
+        """
+        agora = time.monotonic()
+        if not forcar and agora - self._ultima_verificacao < self.intervalo_verificacao:
+            return set()
+        with self._trava_atualizacao:
+            self._ultima_verificacao = agora
+            vistos = {}
+            try:
+                with os.scandir(self.pasta) as it:
+                    for entry in it:
+                        if entry.is_file() and entry.name.endswith('.json'):
+                            vistos[id_do_arquivo(entry.name)] = _assinatura(entry.stat())
+            except FileNotFoundError:
+                pass
+
+            entradas = dict(self._entradas)
+            mudados = set(entradas) - set(vistos)
+            for template_id in mudados:
+                del entradas[template_id]
+
+            for template_id, assinatura in vistos.items():
+                atual = entradas.get(template_id)
+                if atual and atual[0] == assinatura:
+                    continue
+                try:
+                    dados = _ler_arquivo(_caminho(self.pasta, template_id))
+                except (OSError, ValueError) as e:
+                    # Mantém a versão anterior (se houver) até o arquivo voltar a ser legível
+                    logger.error(f"Template '{template_id}' ilegível: {e}")
+                    continue
+                entradas[template_id] = (assinatura, dados.get('versao', 0), dados['config'])
+                mudados.add(template_id)
+
+            if mudados:
+                self._entradas = entradas
+                self._snapshot = MappingProxyType({tid: e[2] for tid, e in sorted(entradas.items())})
+            return mudados
+
+    # --- Escrita ---
+    def _adquirir_trava(self, path: Path) -> Path:
+        trava = path.with_name(path.name + ".lock")
+        inicio = time.monotonic()
+        while True:
+            try:
+                os.close(os.open(trava, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+                return trava
+            except FileExistsError:
+                try:
+                    if time.time() - trava.stat().st_mtime > TRAVA_TIMEOUT:
+                        trava.unlink(missing_ok=True) # Dono caiu no meio da gravação
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() - inicio > TRAVA_TIMEOUT:
+                    raise TimeoutError(f"Template '{path.stem}' está sendo salvo por outro processo.")
+                time.sleep(0.05)
+
+    def salvar(self, template_id: str, config: dict, versao_esperada: int | None = None,
+               exigir_novo: bool = False) -> int:
+        """
+        Grava um template (temporário + rename atômico) e retorna a nova versão.
+        Com 'versao_esperada', falha com ConflitoVersao se o arquivo em disco tiver
+        outra versão (alguém salvou depois que você leu). Com 'exigir_novo', falha se
+        o template já existir (alguém criou o mesmo ID enquanto você editava).
+        """
+        path = _caminho(self.pasta, template_id)
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        trava = self._adquirir_trava(path)
+        try:
+            try:
+                versao_atual = _ler_arquivo(path).get('versao', 0)
+            except FileNotFoundError:
+                versao_atual = None
+            if exigir_novo and versao_atual is not None:
+                raise ConflitoVersao(f"Template '{template_id}' já foi criado por outro processo (versão {versao_atual}).")
+            if versao_esperada is not None and versao_atual != versao_esperada:
+                raise ConflitoVersao(f"Template '{template_id}' foi alterado por outro processo "
+                                     f"(versão {versao_atual}, esperada {versao_esperada}).")
+
+            nova_versao = (versao_atual or 0) + 1
+            _gravar_arquivo(path, nova_versao, config)
+        finally:
+            trava.unlink(missing_ok=True)
+
+        logger.info(f"Template '{template_id}' salvo (versão {nova_versao}) em '{path}'.")
+        self.atualizar(forcar=True)
+        return nova_versao
+
+# --- Migração ---
+def _tem_conteudo(path: Path) -> bool:
+    try:
+        return path.stat().st_size > 0
+    except FileNotFoundError:
+        return False
+
+def _restos_de_gravacao(pasta: Path) -> list[Path]:
+    """
+    Arquivos de uma pasta sem templates. Só travas e temporários de uma gravação
+    interrompida são aceitos; qualquer outro arquivo faz a migração parar.
+    """
+    if not pasta.exists():
+        return []
+    restos = list(pasta.iterdir())
+    desconhecidos = [p.name for p in restos if p.is_dir() or not p.name.endswith(('.lock', '.tmp'))]
+    if desconhecidos:
+        raise FileExistsError(f"'{pasta}' não tem templates, mas tem outros arquivos ({', '.join(sorted(desconhecidos))}). "
+                              f"Remova-os antes de migrar.")
+    return restos
+
+def migrar_templates_json(legado: Path = TEMPLATES_JSON_LEGADO, pasta: Path = TEMPLATES_DIR) -> int:
+    """
+    Converte o templates.json antigo em um arquivo por template (versão 1).
+    Tudo é gravado numa pasta temporária, que só vira 'pasta' (rename) no fim:
+    uma migração interrompida não deixa meia pasta que esconderia o resto.
+    Não roda se 'pasta' já tiver templates. Travas e temporários deixados por uma
+    gravação interrompida são removidos; outros arquivos fazem a migração falhar
+    (FileExistsError). O templates.json não é alterado.
+    Retorna quantos templates foram migrados.
+    """
+    if not _tem_conteudo(legado):
+        logger.info(f"'{legado}' vazio ou inexistente: nada a migrar.")
+        return 0
+    if pasta.exists() and any(pasta.glob("*.json")):
+        logger.info(f"'{pasta}' já tem templates: migração não é necessária.")
+        return 0
+    restos = _restos_de_gravacao(pasta)
+
+    with open(legado, 'r', encoding='utf-8') as f:
+        templates = json.load(f)
+
+    tmp_dir = pasta.with_name(f"{pasta.name}.migrando-{uuid.uuid4().hex[:8]}")
+    tmp_dir.mkdir(parents=True)
+    try:
+        migrados = 0
+        for template_id, config in templates.items():
+            if not template_id or not isinstance(config, dict):
+                logger.error(f"Template '{template_id}' ignorado na migração: entrada inválida.")
+                continue
+            _gravar_arquivo(_caminho(tmp_dir, template_id), 1, config)
+            migrados += 1
+
+        if pasta.exists():
+            # rename não substitui pasta no Windows (nem pasta não vazia no POSIX): tira os restos e a pasta
+            for path in restos:
+                logger.info(f"Removendo '{path.name}', resto de uma gravação interrompida.")
+                path.unlink(missing_ok=True)
+            pasta.rmdir()
+        os.rename(tmp_dir, pasta)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True) # Não deixa pastas '.migrando-*' para trás
+        raise
+    logger.info(f"{migrados} templates migrados de '{legado.name}' para '{pasta}'. "
+                f"'{legado.name}' não é mais lido e pode ser removido.")
+    return migrados
+
+# --- Ponto de Entrada Principal ---
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Repositório de templates (um arquivo por template).")
+    parser.add_argument("--migrar", action="store_true", help="Converte o templates.json antigo para a pasta de templates.")
+    args = parser.parse_args()
+
+    if args.migrar:
+        migrar_templates_json()
+    repositorio = RepositorioTemplates(legado=None)
+    for template_id in repositorio.snapshot():
+        logger.info(f"  {template_id} (versão {repositorio.versao(template_id)})")
@@ -1,10 +1,11 @@
 import customtkinter as ctk
-import json
 from pathlib import Path
 import logging
 from PIL import Image, ImageDraw, ImageFont, ImageTk
 from tkinter import colorchooser, messagebox
-import fitz # <-- IMPORTANTE: Nova biblioteca
+from catalogo_assets import atualizar_catalogo, info_base, listar_bases, listar_fontes, tamanho_pagina_pixels
+from carregador_bases import carregar_pagina
+from repositorio_templates import ConflitoVersao, RepositorioTemplates
 
 # --- Configuração de Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,65 +13,37 @@ logger = logging.getLogger(__name__)
 
 # --- Definição de Caminhos ---
 BASE_DIR = Path(__file__).parent
-TEMPLATE_CONFIG_FILE = BASE_DIR / "templates.json"
 FONT_DIR = BASE_DIR / "fonts"
-PICTURE_DIR = BASE_DIR / "pictures" # Agora vamos procurar PDFs aqui
+PICTURE_DIR = BASE_DIR / "pictures" # Bases em PDF ou imagem (JPG/PNG)
 
-# --- Listar Arquivos Disponíveis ---
+# --- Listar Arquivos Disponíveis (via catálogo de assets) ---
+CATALOGO = {'bases': {}, 'fontes': {}}
 try:
-    # --- MUDANÇA AQUI: Lista PDFs, não imagens ---
-    AVAILABLE_BASE_PDFS = sorted([f.name for f in PICTURE_DIR.iterdir() if f.suffix.lower() == '.pdf'])
-    if not AVAILABLE_BASE_PDFS:
-        AVAILABLE_BASE_PDFS = ["(Nenhum PDF encontrado em /pictures)"]
-except FileNotFoundError:
-    logger.warning(f"Pasta de imagens/PDFs '{PICTURE_DIR}' não encontrada.")
-    AVAILABLE_BASE_PDFS = ["(Nenhuma pasta /pictures)"]
+    CATALOGO = atualizar_catalogo()
+except Exception as e:
+    logger.warning(f"Não foi possível atualizar o catálogo de assets: {e}")
 
-try:
-    AVAILABLE_FONTS = sorted(["(Padrão do Template)"] + [f.name for f in FONT_DIR.iterdir() if f.suffix.lower() in ('.ttf', '.otf')])
-except FileNotFoundError:
-    logger.warning(f"Pasta de fontes '{FONT_DIR}' não encontrada.")
-    AVAILABLE_FONTS = ["(Nenhuma fonte encontrada)"]
+AVAILABLE_BASE_PDFS = listar_bases(CATALOGO)
+if not AVAILABLE_BASE_PDFS:
+    AVAILABLE_BASE_PDFS = ["(Nenhuma base encontrada em /pictures)"]
 
-# (As funções load_templates e save_templates permanecem as mesmas)
-def load_templates():
-    if not TEMPLATE_CONFIG_FILE.exists(): return {}
-    try:
-        with open(TEMPLATE_CONFIG_FILE, 'r', encoding='utf-8') as f: return json.load(f)
-    except Exception as e:
-        logger.error(f"Erro ao carregar 'templates.json': {e}"); return {}
+AVAILABLE_FONTS = sorted(["(Padrão do Template)"] + listar_fontes(CATALOGO))
 
-def save_templates(templates_data):
-    try:
-        with open(TEMPLATE_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(templates_data, f, indent=2, ensure_ascii=False)
-        logger.info(f"Templates salvos com sucesso em '{TEMPLATE_CONFIG_FILE}'")
-        return True
-    except Exception as e:
-        logger.error(f"Erro ao salvar 'templates.json': {e}"); return False
+# --- Repositório de Templates (um arquivo por template, com versão) ---
+REPOSITORIO_TEMPLATES = RepositorioTemplates()
 
-# --- NOVA FUNÇÃO HELPER ---
-def _extract_pdf_page_to_pil(pdf_path: Path, page_num: int = 0, dpi: int = 150) -> Image.Image | None:
-    """Extrai uma página de PDF e a converte para um objeto PIL.Image."""
-    doc = None
-    try:
-        doc = fitz.open(pdf_path)
-        if page_num >= len(doc):
-            logger.error(f"PDF tem apenas {len(doc)} páginas. Não foi possível extrair a página {page_num + 1}.")
-            return None
-        
-        page = doc[page_num]
-        mat = fitz.Matrix(dpi / 72, dpi / 72) # Renderiza em 150 DPI para a UI
-        pix = page.get_pixmap(matrix=mat, alpha=False) # alpha=False para RGB
-        
-        img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
-        return img
-    except Exception as e:
-        logger.error(f"Erro ao extrair página do PDF '{pdf_path.name}': {e}")
-        return None
-    finally:
-        if doc:
-            doc.close()
+def load_templates():
+    REPOSITORIO_TEMPLATES.atualizar(forcar=True)
+    return REPOSITORIO_TEMPLATES.snapshot()
+
+def save_templates(template_id, config_data, versao_vista=None):
+    """
+    Salva só este template (os outros arquivos não são tocados). Retorna a nova versão.
+    'versao_vista' é a versão que o formulário viu (None: o template não existia).
+    Levanta ConflitoVersao se outra pessoa salvou ou criou o mesmo template desde então.
+    """
+    return REPOSITORIO_TEMPLATES.salvar(template_id, config_data, versao_esperada=versao_vista,
+                                        exigir_novo=versao_vista is None)
 
 # --- Configuração da UI ---
 ctk.set_appearance_mode("Dark") 
@@ -83,6 +56,7 @@ class TemplateEditorApp(ctk.CTk):
         self.geometry("1200x800")
         
         self.templates_data = load_templates()
+        self.versoes_abertas = {} # Template -> versão vista no formulário, None se não existia (checagem ao salvar)
         self.original_pil_image = None
         self.display_pil_image = None
         self.display_ctk_image = None
@@ -95,6 +69,7 @@ class TemplateEditorApp(ctk.CTk):
         # --- Variáveis da UI ---
         self.selected_pdf_var = ctk.StringVar(value=AVAILABLE_BASE_PDFS[0])
         self.template_id_var = ctk.StringVar(value="") 
+        self.template_id_var.trace_add("write", self._on_template_id_change)
         self.pos_x_var = ctk.StringVar(value="0")
         self.pos_y_var = ctk.StringVar(value="0")
         self.max_width_var = ctk.StringVar(value="0")
@@ -172,17 +147,26 @@ class TemplateEditorApp(ctk.CTk):
         self.canvas.bind("<ButtonRelease-1>", self._on_mouse_release)
         
         # Carrega o primeiro PDF da lista, se existir
-        if AVAILABLE_BASE_PDFS[0].endswith(".pdf"):
+        if not AVAILABLE_BASE_PDFS[0].startswith("("):
             self._on_pdf_select(self.selected_pdf_var.get())
             self._load_pdf_page()
 
+    def _on_template_id_change(self, *_):
+        """ID digitado: guarda a versão que existe agora (ou None), para o salvar detectar conflito."""
+        template_id = self.template_id_var.get().strip()
+        if template_id and template_id not in self.versoes_abertas:
+            REPOSITORIO_TEMPLATES.atualizar()
+            self.versoes_abertas[template_id] = REPOSITORIO_TEMPLATES.versao(template_id)
+
     def _on_pdf_select(self, selected_pdf_name):
         """Chamado quando o usuário troca o PDF no dropdown."""
         # Tenta adivinhar o nome do template a partir do nome do PDF
         template_id = Path(selected_pdf_name).stem + "_template"
         self.template_id_var.set(template_id)
         
-        # Verifica se um template com este ID já existe
+        # Verifica se um template com este ID já existe (relendo o que outros salvaram)
+        self.templates_data = load_templates()
+        self.versoes_abertas[template_id] = REPOSITORIO_TEMPLATES.versao(template_id) # None: template novo
         if template_id in self.templates_data:
             config = self.templates_data[template_id]
             self.pos_x_var.set(config.get("pos_x", 0))
@@ -200,31 +184,34 @@ class TemplateEditorApp(ctk.CTk):
             self.max_width_var.set("0")
 
     def _load_pdf_page(self, draw_saved_rect=False):
-        """Extrai a primeira página do PDF e a exibe no canvas."""
+        """Decodifica a primeira página da base (PDF ou imagem) e a exibe no canvas."""
         pdf_name = self.selected_pdf_var.get()
         pdf_path = PICTURE_DIR / pdf_name
+        info = info_base(CATALOGO, pdf_name)
         
-        if not pdf_path.exists():
-            logger.warning(f"PDF {pdf_name} não encontrado.")
-            self.canvas.delete("all")
-            return
-            
-        # --- MUDANÇA AQUI: Usa o helper do PyMuPDF ---
-        self.original_pil_image = _extract_pdf_page_to_pil(pdf_path, page_num=0, dpi=300)
-        # dpi=300 para que as coordenadas salvas sejam de alta resolução
-        
-        if not self.original_pil_image:
+        if not pdf_path.exists() or not info:
+            logger.warning(f"Base {pdf_name} não encontrada.")
             self.canvas.delete("all")
             return
         
-        # (O resto desta função é idêntico, apenas redimensiona e exibe a imagem PIL)
         canvas_width = self.image_frame.winfo_width()
         canvas_height = self.image_frame.winfo_height()
         
         if canvas_width < 50 or canvas_height < 50: 
             canvas_width, canvas_height = 800, 750 
 
-        self.original_width, self.original_height = self.original_pil_image.size
+        # As coordenadas salvas são sempre em resolução total (300 DPI para PDFs,
+        # pixels nativos para imagens), mas a prévia já é decodificada no tamanho da tela
+        self.original_width, self.original_height = tamanho_pagina_pixels(info, 0, dpi=300)
+        try:
+            self.original_pil_image = carregar_pagina(pdf_path, 0, dpi=300, tamanho_max=(canvas_width, canvas_height))
+        except Exception as e:
+            logger.error(f"Erro ao carregar a base '{pdf_name}': {e}")
+            self.original_pil_image = None
+        
+        if not self.original_pil_image:
+            self.canvas.delete("all")
+            return
         
         ratio = min(canvas_width / self.original_width, canvas_height / self.original_height)
         self.display_width = int(self.original_width * ratio)
@@ -303,11 +290,13 @@ class TemplateEditorApp(ctk.CTk):
                 "align": self.align_var.get()
             }
             config_data = {k: v for k, v in config_data.items() if v is not None}
-            self.templates_data[template_id_name] = config_data
-            if save_templates(self.templates_data):
-                messagebox.showinfo("Sucesso", f"Template para '{template_id_name}' salvo com sucesso!")
-            else:
-                messagebox.showerror("Erro", "Falha ao salvar o arquivo 'templates.json'.")
+            versao = save_templates(template_id_name, config_data, self.versoes_abertas.get(template_id_name))
+            self.versoes_abertas[template_id_name] = versao
+            self.templates_data = REPOSITORIO_TEMPLATES.snapshot()
+            messagebox.showinfo("Sucesso", f"Template para '{template_id_name}' salvo com sucesso (versão {versao})!")
+        except ConflitoVersao as e:
+            self.versoes_abertas.pop(template_id_name, None) # Redigitar o ID ou reselecionar a base registra a versão atual
+            messagebox.showerror("Conflito", f"{e}\nSelecione a base de novo para recarregar o template antes de salvar.")
         except ValueError:
             messagebox.showwarning("Erro", "Tamanho da fonte, X, Y e Largura devem ser números inteiros.")
         except Exception as e:
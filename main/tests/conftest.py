@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Os módulos ficam soltos em main/ (sem pacote): os testes importam como os scripts fazem
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
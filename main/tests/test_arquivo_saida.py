@@ -0,0 +1,66 @@
+import hashlib
+import json
+import tarfile
+import zipfile
+
+import pytest
+
+from arquivo_saida import GravadorArquivo
+
+def _pdf(n: int, tamanho: int = 1000) -> bytes:
+    return bytes([n % 256]) * tamanho
+
+def _ler(path, formato):
+    if formato == 'zip':
+        with zipfile.ZipFile(path) as z:
+            return {nome: z.read(nome) for nome in z.namelist()}
+    with tarfile.open(path) as t:
+        return {m.name: t.extractfile(m).read() for m in t.getmembers()}
+
+def test_formato_invalido(tmp_path):
+    with pytest.raises(ValueError):
+        GravadorArquivo(tmp_path, formato="rar")
+
+@pytest.mark.parametrize("formato", ["zip", "tar"])
+def test_volume_unico_e_indice(tmp_path, formato):
+    with GravadorArquivo(tmp_path, formato=formato) as arquivo:
+        assert arquivo.adicionar("a.pdf", _pdf(1)) == f"lote.{formato}:a.pdf"
+        arquivo.adicionar("b.pdf", _pdf(2))
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["lote-indice.json", f"lote.{formato}"]
+    assert _ler(tmp_path / f"lote.{formato}", formato) == {"a.pdf": _pdf(1), "b.pdf": _pdf(2)}
+    indice = json.loads((tmp_path / "lote-indice.json").read_text())
+    assert indice['formato'] == formato
+    assert indice['pedidos']["b.pdf"] == {'arquivo': f"lote.{formato}", 'membro': "b.pdf", 'bytes': 1000,
+                                          'sha256': hashlib.sha256(_pdf(2)).hexdigest()}
+
+@pytest.mark.parametrize("formato", ["zip", "tar"])
+def test_divisao_em_volumes(tmp_path, formato):
+    with GravadorArquivo(tmp_path, formato=formato, volume_max_bytes=5000) as arquivo:
+        for n in range(10):
+            arquivo.adicionar(f"{n}.pdf", _pdf(n))
+
+    indice = json.loads((tmp_path / "lote-indice.json").read_text())
+    volumes = [v['arquivo'] for v in indice['volumes']]
+    assert len(volumes) > 1
+    assert volumes == sorted(volumes) and volumes[0] == f"lote-0001.{formato}"
+    assert not list(tmp_path.glob("*.part")) # Nenhum volume ficou pela metade
+    conteudo = {}
+    for volume in indice['volumes']:
+        membros = _ler(tmp_path / volume['arquivo'], formato)
+        assert len(membros) == volume['membros']
+        assert all(indice['pedidos'][nome]['arquivo'] == volume['arquivo'] for nome in membros)
+        conteudo.update(membros)
+    assert conteudo == {f"{n}.pdf": _pdf(n) for n in range(10)}
+
+@pytest.mark.parametrize("formato", ["zip", "tar"])
+def test_pedidos_duplicados_viram_membros(tmp_path, formato):
+    with GravadorArquivo(tmp_path, formato=formato) as arquivo:
+        arquivo.adicionar("a.pdf", _pdf(7), ["a.pdf", "a2.pdf", "a3.pdf"])
+
+    assert _ler(tmp_path / f"lote.{formato}", formato) == {nome: _pdf(7) for nome in ("a.pdf", "a2.pdf", "a3.pdf")}
+    indice = json.loads((tmp_path / "lote-indice.json").read_text())
+    assert [indice['pedidos'][nome]['membro'] for nome in ("a.pdf", "a2.pdf", "a3.pdf")] == ["a.pdf", "a2.pdf", "a3.pdf"]
+    if formato == 'tar':
+        with tarfile.open(tmp_path / "lote.tar") as t:
+            assert [m.islnk() for m in t.getmembers()] == [False, True, True] # Os bytes entram uma vez só
@@ -0,0 +1,131 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+import carregador_bases
+from carregador_bases import (DPI_PADRAO, LIMITE_CACHE_PADRAO, bytes_imagem, carregar_pagina, carregar_pagina_cache,
+                              carregar_pagina_no_dpi, decodificador_em_processos, definir_limite_cache, dpi_da_imagem,
+                              limite_cache, limpar_cache_paginas, pagina_em_cache, reamostrar_para_dpi)
+
+def _imagem(tamanho, dpi=None) -> Image.Image:
+    img = Image.new("RGB", tamanho, "white")
+    if dpi:
+        img.info['dpi'] = (dpi, dpi)
+    return img
+
+def test_dpi_da_imagem():
+    assert dpi_da_imagem(_imagem((10, 10), 150)) == 150
+    assert dpi_da_imagem(_imagem((10, 10))) == DPI_PADRAO
+    assert dpi_da_imagem(_imagem((10, 10), 0)) == DPI_PADRAO
+
+def test_reamostrar_mantem_tamanho_fisico():
+    # Verso de 736x920 px a 149.86 dpi atrás de uma frente de 240 dpi: 353x442 pt nos dois DPIs
+    verso = _imagem((736, 920), 149.86)
+    novo = reamostrar_para_dpi(verso, 240)
+    assert novo.size == (1179, 1473)
+    assert dpi_da_imagem(novo) == 240
+    assert round(novo.width * 72 / 240) == round(verso.width * 72 / 149.86) == 354
+    assert verso.size == (736, 920) # A original (que pode estar no cache) não muda
+
+def test_reamostrar_mesmo_dpi_nao_copia():
+    img = _imagem((100, 100), 300)
+    assert reamostrar_para_dpi(img, 300) is img
+
+# --- Decodificação em Outros Processos ---
+PICTURES = Path(__file__).resolve().parent.parent / "pictures"
+
+def _blocos_compartilhados() -> set[str]:
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+@pytest.mark.parametrize("nome", ["Robot-girl.jpg", "claudia.pdf"])
+def test_decodificar_em_processos_igual_ao_local(nome):
+    antes = _blocos_compartilhados()
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as processos:
+        img = decodificador_em_processos(processos)(PICTURES / nome, 0, dpi=30)
+    esperado = carregar_pagina(PICTURES / nome, 0, dpi=30)
+    assert img.size == esperado.size
+    assert img.tobytes() == esperado.tobytes()
+    assert dpi_da_imagem(img) == pytest.approx(dpi_da_imagem(esperado))
+    assert _blocos_compartilhados() == antes
+
+def test_bloco_apagado_quando_a_decodificacao_falha(monkeypatch):
+    def falhar(*args):
+        raise RuntimeError("erro do MuPDF")
+        yield
+
+    monkeypatch.setattr(carregador_bases, "_pixmaps_da_pagina", falhar)
+    antes = _blocos_compartilhados()
+    with ThreadPoolExecutor(max_workers=1) as executor: # Em thread para o monkeypatch valer
+        with pytest.raises(RuntimeError):
+            decodificador_em_processos(executor)(PICTURES / "claudia.pdf", 0, dpi=30)
+    assert _blocos_compartilhados() == antes
+
+# --- Páginas no DPI da Frente ---
+def test_pdf_rasterizado_direto_no_dpi():
+    limpar_cache_paginas()
+    decodificados = []
+
+    def decodificar(*args):
+        decodificados.append(args[2])
+        return carregar_pagina(*args)
+
+    img = carregar_pagina_no_dpi(PICTURES / "claudia.pdf", 0, 20, decodificar=decodificar)
+    assert decodificados == [20] # Sem passar por 300 DPI e reamostrar
+    assert dpi_da_imagem(img) == pytest.approx(20)
+    limpar_cache_paginas()
+
+def test_imagem_reamostrada_fica_no_cache():
+    limpar_cache_paginas()
+    primeira = carregar_pagina_no_dpi(PICTURES / "Robot-girl.jpg", 0, 100)
+    assert dpi_da_imagem(primeira) == 100
+    assert carregar_pagina_no_dpi(PICTURES / "Robot-girl.jpg", 0, 100) is primeira
+    original = carregar_pagina_cache(PICTURES / "Robot-girl.jpg", 0)
+    assert carregar_pagina_no_dpi(PICTURES / "Robot-girl.jpg", 0, dpi_da_imagem(original)) is original
+    limpar_cache_paginas()
+
+# --- Limites do Cache ---
+def test_cache_tem_limite_de_bytes_por_padrao():
+    assert limite_cache() == LIMITE_CACHE_PADRAO
+
+def test_pagina_maior_que_o_limite_nao_fica_no_cache():
+    limpar_cache_paginas()
+    pequena = carregar_pagina(PICTURES / "Robot-girl.jpg")
+    try:
+        definir_limite_cache(bytes_imagem(pequena) - 1)
+        carregar_pagina_cache(PICTURES / "Robot-girl.jpg")
+        assert not pagina_em_cache(PICTURES / "Robot-girl.jpg")
+        definir_limite_cache(bytes_imagem(pequena))
+        carregar_pagina_cache(PICTURES / "Robot-girl.jpg")
+        assert pagina_em_cache(PICTURES / "Robot-girl.jpg")
+        definir_limite_cache(bytes_imagem(pequena) - 1) # Baixar o limite despeja o que não cabe mais
+        assert not pagina_em_cache(PICTURES / "Robot-girl.jpg")
+    finally:
+        definir_limite_cache()
+        limpar_cache_paginas()
+
+# --- Transparência ---
+@pytest.mark.parametrize("modo", ["RGBA", "LA", "P"])
+def test_transparencia_vira_branco(tmp_path, modo):
+    img = Image.new("RGBA", (4, 2), (0, 0, 0, 0)) # Transparente, com preto por baixo
+    img.putpixel((1, 0), (255, 0, 0, 255))
+    if modo == "RGBA":
+        img.putpixel((2, 0), (255, 0, 0, 128)) # Meio transparente
+    elif modo == "LA":
+        img = img.convert("LA")
+    else:
+        img = img.convert("P")
+        img.info['transparency'] = img.getpixel((0, 0))
+    path = tmp_path / "arte.png"
+    img.save(path, dpi=(150, 150))
+
+    pagina = carregar_pagina(path)
+    assert pagina.mode == "RGB"
+    assert pagina.getpixel((0, 0)) == (255, 255, 255)
+    assert pagina.getpixel((1, 0)) == ((255, 0, 0) if modo != "LA" else (76, 76, 76))
+    if modo == "RGBA":
+        assert pagina.getpixel((2, 0)) == (255, 127, 127)
+    assert dpi_da_imagem(pagina) == pytest.approx(150, abs=0.1) # O PNG guarda em pixels por metro
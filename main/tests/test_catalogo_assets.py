@@ -0,0 +1,89 @@
+import os
+import shutil
+
+import fitz
+import pytest
+from PIL import Image
+
+import catalogo_assets
+from catalogo_assets import (atualizar_catalogo, carregar_catalogo, dpi_pagina, info_base, listar_bases, listar_fontes,
+                             tamanho_pagina_pixels, tamanho_pagina_pontos)
+
+FONTE = catalogo_assets.FONT_DIR / "sao.ttf"
+
+@pytest.fixture
+def pastas(tmp_path, monkeypatch):
+    """Catálogo isolado: pictures/, fonts/ e .cache/ dentro de tmp_path."""
+    pictures, fonts, cache = tmp_path / "pictures", tmp_path / "fonts", tmp_path / ".cache"
+    pictures.mkdir()
+    fonts.mkdir()
+    monkeypatch.setattr(catalogo_assets, "PICTURE_DIR", pictures)
+    monkeypatch.setattr(catalogo_assets, "FONT_DIR", fonts)
+    monkeypatch.setattr(catalogo_assets, "CACHE_DIR", cache)
+    monkeypatch.setattr(catalogo_assets, "CATALOGO_FILE", cache / "catalogo_assets.json")
+    monkeypatch.setattr(catalogo_assets, "THUMB_DIR_LEGADO", cache / "thumbs")
+    return pictures, fonts, cache
+
+def _gravar_pdf(path, paginas: list[tuple[float, float]]):
+    doc = fitz.open()
+    for largura, altura in paginas:
+        doc.new_page(width=largura, height=altura)
+    doc.save(path)
+    doc.close()
+
+def test_indexa_bases_e_fontes(pastas):
+    pictures, fonts, _ = pastas
+    Image.new("RGB", (600, 300), "white").save(pictures / "a.png", dpi=(150, 150))
+    _gravar_pdf(pictures / "b.pdf", [(595, 842), (144, 72)])
+    (pictures / "notas.txt").write_text("não é base")
+    shutil.copy(FONTE, fonts / "sao.ttf")
+
+    catalogo = atualizar_catalogo()
+    assert listar_bases(catalogo) == ["a.png", "b.pdf"]
+    assert listar_fontes(catalogo) == ["sao.ttf"]
+
+    imagem, pdf = info_base(catalogo, "a.png"), info_base(catalogo, "b.pdf")
+    assert (imagem['tipo'], imagem['paginas'], imagem['dimensoes']) == ("raster", 1, [[600, 300]])
+    assert dpi_pagina(imagem) == pytest.approx(150, abs=0.1)
+    assert tamanho_pagina_pixels(imagem) == (600, 300)
+    assert tamanho_pagina_pontos(imagem) == pytest.approx((288, 144), abs=0.1)
+
+    assert (pdf['tipo'], pdf['paginas']) == ("pdf", 2)
+    assert dpi_pagina(pdf, 200) == 200
+    assert tamanho_pagina_pixels(pdf, 1, 150) == (300, 150)
+    assert tamanho_pagina_pontos(pdf, 1) == (144, 72)
+    assert 'miniatura' not in pdf
+
+    assert carregar_catalogo() == catalogo # Salvo em disco
+
+def test_reindexa_so_o_que_mudou(pastas, monkeypatch):
+    pictures, _, _ = pastas
+    Image.new("RGB", (100, 100)).save(pictures / "a.png")
+    Image.new("RGB", (100, 100)).save(pictures / "b.png")
+    atualizar_catalogo()
+
+    abertos = []
+    extrair = catalogo_assets._metadados_base
+    monkeypatch.setattr(catalogo_assets, "_metadados_base", lambda path, st: abertos.append(path.name) or extrair(path, st))
+
+    Image.new("RGB", (200, 50)).save(pictures / "b.png")
+    st = (pictures / "b.png").stat()
+    os.utime(pictures / "b.png", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9)) # Garante mtime diferente
+    (pictures / "a.png").unlink()
+
+    catalogo = atualizar_catalogo()
+    assert abertos == ["b.png"]
+    assert listar_bases(catalogo) == ["b.png"]
+    assert info_base(catalogo, "b.png")['dimensoes'] == [[200, 50]]
+
+def test_remove_miniaturas_do_formato_antigo(pastas):
+    pictures, _, cache = pastas
+    Image.new("RGB", (100, 100)).save(pictures / "a.png")
+    (cache / "thumbs").mkdir(parents=True)
+    (cache / "thumbs" / "0123456789abcdef.png").touch()
+    (cache / "catalogo_assets.json").write_text('{"versao": 2, "bases": {}, "fontes": {}}')
+
+    catalogo = atualizar_catalogo()
+    assert listar_bases(catalogo) == ["a.png"]
+    assert not (cache / "thumbs").exists()
+    assert carregar_catalogo()['versao'] == catalogo_assets.CATALOGO_VERSAO
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from desenho_texto import (carregar_fonte, compor_sprite, layout_templated_text, render_text_sprite, resolver_nome_fonte,
+                           restaurar_regiao)
+
+TEXTO = "Maria Aparecida dos Santos Oliveira"
+
+def _pagina(largura: int = 500, altura: int = 400) -> Image.Image:
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (altura, largura, 3), dtype=np.uint8), "RGB")
+
+def _caminho_antigo(pagina: Image.Image, config: dict) -> Image.Image:
+    """Como era antes dos sprites: converte a página para RGBA, desenha e volta para RGB."""
+    img = pagina.convert("RGBA")
+    draw = ImageDraw.Draw(img)
+    font = carregar_fonte(resolver_nome_fonte(config), config.get('font_size', 50))
+    for x, y, linha in layout_templated_text(config, TEXTO, font):
+        draw.text((x, y), linha, font=font, fill=config.get('color', '#000000'))
+    return img.convert("RGB")
+
+@pytest.mark.parametrize("align", ["left", "center", "right"])
+@pytest.mark.parametrize("cor", ["#FFFFFF", "#123456", "#FF0000"])
+@pytest.mark.parametrize("posicao", [(40, 30), (-20, -10), (420, 370)]) # Dentro e cortado pelas bordas
+def test_sprite_igual_ao_caminho_antigo(align, cor, posicao):
+    config = {'pos_x': posicao[0], 'pos_y': posicao[1], 'max_width_pixels': 300,
+              'font_size': 37, 'color': cor, 'align': align}
+    pagina = _pagina()
+    esperado = _caminho_antigo(pagina, config)
+
+    img = pagina.copy()
+    sprite, origem = render_text_sprite(config, TEXTO)
+    compor_sprite(img, sprite, origem)
+    assert np.array_equal(np.asarray(img), np.asarray(esperado))
+
+def test_restaurar_regiao():
+    config = {'pos_x': 40, 'pos_y': 30, 'max_width_pixels': 300, 'font_size': 37, 'color': "#FFFFFF"}
+    pagina = _pagina()
+    img = pagina.copy()
+    regiao = compor_sprite(img, *render_text_sprite(config, TEXTO))
+    assert not np.array_equal(np.asarray(img), np.asarray(pagina))
+    restaurar_regiao(img, regiao)
+    assert np.array_equal(np.asarray(img), np.asarray(pagina))
+
+def test_pagina_precisa_ser_rgb():
+    config = {'pos_x': 0, 'pos_y': 0, 'max_width_pixels': 300, 'font_size': 37}
+    with pytest.raises(ValueError):
+        compor_sprite(_pagina().convert("RGBA"), *render_text_sprite(config, TEXTO))
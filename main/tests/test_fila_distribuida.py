@@ -0,0 +1,112 @@
+import json
+import os
+import time
+
+from fila_distribuida import (Lease, _caminho_heartbeat, _processar_um_shard, consolidar_resultados,
+                              executar_trabalhador, id_execucao, preparar_execucao, retomar_se_vencido)
+
+def _gravar_lease(path, token="antigo", expira_em=None):
+    path.write_text(json.dumps({'trabalhador': 'outro', 'token': token,
+                                'expira_em': time.time() - 1 if expira_em is None else expira_em}))
+
+def _relatorio(indices):
+    return {'total': len(indices), 'validos': len(indices), 'invalidos': 0, 'com_avisos': 0,
+            'custo_estimado': {'pixels_mb': 1.0, 'maior_pagina_mb': 1.0},
+            'pedidos': [{'indice': i, 'status': 'ok'} for i in indices]}
+
+# --- Leases ---
+def test_lease_exclusivo(tmp_path):
+    path = tmp_path / "shard-0000.lease"
+    primeiro, segundo = Lease(path, "a", 60), Lease(path, "b", 60)
+    assert primeiro.adquirir()
+    assert not segundo.adquirir()
+    primeiro.liberar()
+    assert not path.exists()
+    assert not _caminho_heartbeat(path, primeiro.token).exists()
+
+def test_lease_vencido_e_retomado(tmp_path):
+    path = tmp_path / "shard-0000.lease"
+    _gravar_lease(path)
+    assert retomar_se_vencido(path, 60)
+    assert not path.exists()
+    assert list(tmp_path.iterdir()) == [] # Nem lápide nem heartbeat do dono antigo ficam para trás
+    assert Lease(path, "b", 60).adquirir()
+
+def test_lease_valido_nao_e_retomado(tmp_path):
+    path = tmp_path / "shard-0000.lease"
+    _gravar_lease(path, expira_em=time.time() + 60)
+    assert not retomar_se_vencido(path, 60)
+    assert json.loads(path.read_text())['token'] == "antigo"
+
+def test_heartbeat_renova_a_validade(tmp_path):
+    path = tmp_path / "shard-0000.lease"
+    _gravar_lease(path) # O arquivo do lease venceu, mas o heartbeat do mesmo token não
+    _caminho_heartbeat(path, "antigo").write_text(json.dumps({'expira_em': time.time() + 60}))
+    assert not retomar_se_vencido(path, 60)
+    assert path.exists()
+
+def test_lease_vazio_recente_nao_e_retomado(tmp_path):
+    path = tmp_path / "shard-0000.lease"
+    path.touch() # Criado com O_EXCL, conteúdo ainda não escrito
+    assert not retomar_se_vencido(path, 60)
+    assert path.exists()
+
+def test_lease_vazio_antigo_e_retomado(tmp_path):
+    path = tmp_path / "shard-0000.lease"
+    path.touch()
+    antigo = time.time() - 120
+    os.utime(path, (antigo, antigo))
+    assert retomar_se_vencido(path, 60)
+    assert not path.exists()
+
+def test_heartbeat_nao_sobrescreve_novo_dono(tmp_path):
+    path = tmp_path / "shard-0000.lease"
+    lease = Lease(path, "a", 0.3)
+    assert lease.adquirir()
+    _gravar_lease(path, token="novo", expira_em=time.time() + 60) # Retomado por outro trabalhador
+    time.sleep(0.5)
+    lease.liberar()
+    assert lease.perdido
+    assert json.loads(path.read_text())['token'] == "novo"
+
+# --- Shards ---
+def test_processar_um_shard_remapeia_indices(tmp_path):
+    (tmp_path / "shards").mkdir()
+    (tmp_path / "resultados").mkdir()
+    pedidos = [[4, {'output_pdf': 'a.pdf'}], [9, {'output_pdf': 'b.pdf'}], [12, {'output_pdf': 'c.pdf'}]]
+    (tmp_path / "shards" / "shard-0003.json").write_text(json.dumps(pedidos))
+    recebidos = []
+
+    def processar_shard(nome, itens):
+        recebidos.append((nome, itens))
+        return {'sucesso': 3, 'falhas': 0, 'relatorio': _relatorio([1, 2, 3])} # Índices locais (1..n)
+
+    _processar_um_shard(tmp_path, "shard-0003", Lease(tmp_path / "x.lease", "a", 60), processar_shard)
+    assert recebidos == [("shard-0003", [(4, {'output_pdf': 'a.pdf'}), (9, {'output_pdf': 'b.pdf'}), (12, {'output_pdf': 'c.pdf'})])]
+    resultado = json.loads((tmp_path / "resultados" / "shard-0003.json").read_text())
+    assert [p['indice'] for p in resultado['relatorio']['pedidos']] == [5, 10, 13]
+
+def test_assets_alterados_geram_execucao_nova(tmp_path):
+    pedidos = [{'output_pdf': 'a.pdf'}]
+    versoes = {'bases': {'base.pdf': 'abc'}, 'fontes': {}, 'templates': {'t': {'font_size': 50}}}
+    exec_dir = preparar_execucao(tmp_path, pedidos, 2, versoes)
+    assert preparar_execucao(tmp_path, pedidos, 2, json.loads(json.dumps(versoes))) == exec_dir
+    corrigida = {**versoes, 'bases': {'base.pdf': 'def'}}
+    assert preparar_execucao(tmp_path, pedidos, 2, corrigida) != exec_dir
+    editado = {**versoes, 'templates': {'t': {'font_size': 60}}}
+    assert id_execucao(pedidos, 2, editado) != exec_dir.name
+
+def test_execucao_completa_cobre_todos_os_pedidos(tmp_path):
+    pedidos = [{'output_pdf': f"{i}.pdf"} for i in range(20)]
+    exec_dir = preparar_execucao(tmp_path, pedidos, n_shards=4)
+    assert preparar_execucao(tmp_path, pedidos, n_shards=4) == exec_dir
+
+    def processar_shard(nome, itens):
+        return {'sucesso': len(itens), 'falhas': 0, 'relatorio': _relatorio(range(1, len(itens) + 1))}
+
+    assert executar_trabalhador(exec_dir, processar_shard, trabalhador="t1") == 4
+    relatorio = consolidar_resultados(exec_dir)
+    assert relatorio['shards_concluidos'] == 4
+    assert relatorio['sucesso'] == 20
+    assert [p['indice'] for p in relatorio['pedidos']] == list(range(1, 21))
+    assert list((exec_dir / "leases").iterdir()) == []
@@ -0,0 +1,116 @@
+import asyncio
+
+from pathlib import Path
+
+import fitz
+import pytest
+from PIL import Image
+
+import motor_pipeline
+from carregador_bases import LIMITE_CACHE_PADRAO, definir_limite_cache, dpi_da_imagem, limite_cache
+from motor_pipeline import FATOR_PDF_CODIFICADO, OrcamentoMemoria, estimar_memoria_pedido, executar_pipeline
+from validacao_pedidos import PICTURE_DIR
+
+TEMPLATES = {'t': {'pos_x': 50, 'pos_y': 100, 'max_width_pixels': 600, 'font_size': 60, 'color': '#FF0000'}}
+FRENTE = PICTURE_DIR / "Robot-girl.jpg"
+
+def _pedido(saida: str, texto: str, verso: str = "Robot-girl.jpg") -> tuple[dict, list]:
+    pedido = {'output_pdf': saida, 'input_pdf_base': FRENTE.name, 'input_verso': verso,
+              'pagina_frente': {'template_imagem': 't', 'texto': texto}}
+    return pedido, [(FRENTE, 0), (PICTURE_DIR / verso, 0)]
+
+def _rodar(pedidos: list[tuple[dict, list]], output_dir, **kwargs) -> dict:
+    pedidos_validos = [(i, pedido, paginas) for i, (pedido, paginas) in enumerate(pedidos)]
+    # Com timeout: uma trava de página esquecida travaria o pipeline para sempre
+    return asyncio.run(asyncio.wait_for(executar_pipeline(pedidos_validos, TEMPLATES, output_dir, trabalhadores_cpu=2, **kwargs), 120))
+
+def _imagens(pdf_path) -> list[bytes]:
+    """JPEG de cada página, como gravado no PDF (o codificador é determinístico)."""
+    with fitz.open(pdf_path) as doc:
+        return [doc.extract_image(page.get_images()[0][0])['image'] for page in doc]
+
+def test_frente_compartilhada_e_restaurada(tmp_path):
+    sozinho = tmp_path / "sozinho"
+    sozinho.mkdir()
+    _rodar([_pedido("b.pdf", "Beatriz")], sozinho)
+
+    resultado = _rodar([_pedido("a.pdf", "Ana"), _pedido("b.pdf", "Beatriz"), _pedido("c.pdf", "Ana")], tmp_path)
+    assert (resultado['sucesso'], resultado['falhas']) == (3, 0)
+    frente_a, verso_a = _imagens(tmp_path / "a.pdf")
+    frente_b, verso_b = _imagens(tmp_path / "b.pdf")
+    # Na mesma página cacheada, o texto de 'a' foi tirado antes de 'b' ser composto
+    assert frente_b == _imagens(sozinho / "b.pdf")[0]
+    assert frente_a != frente_b
+    # O verso é a mesma imagem da frente: não pode sair com o texto
+    assert verso_a == verso_b != frente_a
+    assert (tmp_path / "c.pdf").read_bytes() == (tmp_path / "a.pdf").read_bytes() # Idêntico: replicado
+
+def test_falha_depois_de_travar_a_pagina_nao_trava_o_lote(tmp_path, monkeypatch):
+    compor = motor_pipeline.compor_sprite
+
+    def compor_ou_falhar(img, sprite, origem):
+        if sprite.width > 300: # Só o texto longo
+            raise RuntimeError("falha ao compor")
+        return compor(img, sprite, origem)
+
+    monkeypatch.setattr(motor_pipeline, "compor_sprite", compor_ou_falhar)
+    resultado = _rodar([_pedido("longo.pdf", "Maria Aparecida Santos"), _pedido("a.pdf", "Ana"), _pedido("b.pdf", "Bia")], tmp_path)
+    assert (resultado['sucesso'], resultado['falhas']) == (2, 1)
+    assert not (tmp_path / "longo.pdf").exists()
+
+def test_verso_em_pdf_sai_no_dpi_da_frente(tmp_path):
+    resultado = _rodar([_pedido("a.pdf", "Ana", verso="claudia.pdf")], tmp_path)
+    assert resultado['sucesso'] == 1
+    with fitz.open(tmp_path / "a.pdf") as doc, fitz.open(PICTURE_DIR / "claudia.pdf") as verso:
+        assert doc[1].rect.width == pytest.approx(verso[0].rect.width, abs=1)
+        assert doc[1].rect.height == pytest.approx(verso[0].rect.height, abs=1)
+
+# --- Orçamento de Memória ---
+MB = 2**20
+
+def _entrada_raster(largura: int, altura: int, dpi: float) -> dict:
+    return {'tipo': 'raster', 'paginas': 1, 'dimensoes': [[largura, altura]], 'dpi': dpi}
+
+def test_orcamento_reserva_espera_e_ajusta_ao_total():
+    async def cenario():
+        orcamento = OrcamentoMemoria(100)
+        assert await orcamento.reservar(500) == 100 # Maior que o total: roda sozinho
+        espera = asyncio.create_task(orcamento.reservar(30))
+        await asyncio.sleep(0.01)
+        assert not espera.done()
+        await orcamento.liberar(100)
+        assert await asyncio.wait_for(espera, 1) == 30
+        assert (orcamento.livre, orcamento.pico) == (70, 100)
+
+    asyncio.run(cenario())
+
+def test_estimativa_conta_verso_reamostrado():
+    # Verso a 150 DPI sai a 300 (o DPI da frente): conta a original e a reamostrada
+    catalogo = {'bases': {'f.png': _entrada_raster(1000, 1000, 300), 'v.png': _entrada_raster(500, 500, 150)}}
+    estimativa = estimar_memoria_pedido([(Path('f.png'), 0), (Path('v.png'), 0)], catalogo)
+    assert estimativa == int(2 * 4_000_000 * FATOR_PDF_CODIFICADO) + 2 * 4_000_000
+
+def test_estimativa_verso_pdf_no_dpi_da_frente():
+    catalogo = {'bases': {'f.png': _entrada_raster(1000, 1000, 150),
+                          'v.pdf': {'tipo': 'pdf', 'paginas': 2, 'dimensoes': [[72, 72], [144, 72]]}}}
+    estimativa = estimar_memoria_pedido([(Path('f.png'), 0), (Path('v.pdf'), 1)], catalogo)
+    verso = 300 * 150 * 4 # Página 1 (2 x 1 pol.) rasterizada a 150 DPI
+    assert estimativa == int((4_000_000 + verso) * FATOR_PDF_CODIFICADO) + 2 * 4_000_000
+
+def test_estimativa_conta_paginas_fora_do_cache():
+    catalogo = {'bases': {'f.png': _entrada_raster(1000, 1000, 300)}}
+    definir_limite_cache(1_000_000)
+    try:
+        estimativa = estimar_memoria_pedido([(Path('f.png'), 0), (Path('f.png'), 0)], catalogo)
+    finally:
+        definir_limite_cache()
+    assert estimativa == 2 * 4_000_000 + int(2 * 4_000_000 * FATOR_PDF_CODIFICADO) + 2 * 4_000_000
+
+def test_pipeline_com_orcamento_respeita_o_total(tmp_path):
+    with Image.open(FRENTE) as img:
+        catalogo = {'bases': {FRENTE.name: _entrada_raster(*img.size, dpi_da_imagem(img))}}
+    resultado = _rodar([_pedido(f"{i}.pdf", f"Pedido {i}") for i in range(4)], tmp_path,
+                       orcamento_bytes=256 * MB, catalogo=catalogo)
+    assert (resultado['sucesso'], resultado['falhas']) == (4, 0)
+    assert resultado['memoria']['pico_reservado_mb'] <= 128 # Metade vai para o cache de páginas
+    assert limite_cache() == LIMITE_CACHE_PADRAO # O limite do cache volta ao padrão no fim
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+import repositorio_templates
+from repositorio_templates import ConflitoVersao, RepositorioTemplates, id_do_arquivo, migrar_templates_json, nome_arquivo
+
+@pytest.fixture
+def repositorio(tmp_path):
+    return RepositorioTemplates(pasta=tmp_path / "templates", legado=None, intervalo_verificacao=0)
+
+@pytest.mark.parametrize("template_id", ["frente_template", "Capa (A4)", "../x", ".oculto", "a/b\\c", "ação:1"])
+def test_nome_arquivo_ida_e_volta(template_id):
+    nome = nome_arquivo(template_id)
+    assert "/" not in nome and "\\" not in nome and not nome.startswith(".")
+    assert id_do_arquivo(nome) == template_id
+
+def test_nome_arquivo_vazio():
+    with pytest.raises(ValueError):
+        nome_arquivo("")
+
+def test_salvar_incrementa_versao(repositorio):
+    assert repositorio.salvar("t", {'pos_x': 1}) == 1
+    assert repositorio.salvar("t", {'pos_x': 2}, versao_esperada=1) == 2
+    assert repositorio.versao("t") == 2
+    assert repositorio.snapshot()["t"] == {'pos_x': 2}
+
+def test_conflito_de_versao(repositorio):
+    repositorio.salvar("t", {'pos_x': 1})
+    repositorio.salvar("t", {'pos_x': 2}, versao_esperada=1) # Outra pessoa salvou depois da leitura
+    with pytest.raises(ConflitoVersao):
+        repositorio.salvar("t", {'pos_x': 3}, versao_esperada=1)
+    assert repositorio.snapshot()["t"] == {'pos_x': 2}
+
+def test_exigir_novo(repositorio):
+    repositorio.salvar("t", {'pos_x': 1}, exigir_novo=True)
+    with pytest.raises(ConflitoVersao):
+        repositorio.salvar("t", {'pos_x': 2}, exigir_novo=True)
+    assert repositorio.versao("t") == 1
+
+def test_atualizar_ve_gravacao_de_outro_processo(repositorio, tmp_path):
+    outro = RepositorioTemplates(pasta=tmp_path / "templates", legado=None)
+    outro.salvar("novo", {'pos_x': 5})
+    assert repositorio.atualizar(forcar=True) == {"novo"}
+    assert repositorio.snapshot()["novo"] == {'pos_x': 5}
+    (tmp_path / "templates" / nome_arquivo("novo")).unlink()
+    assert repositorio.atualizar(forcar=True) == {"novo"}
+    assert "novo" not in repositorio.snapshot()
+
+def test_snapshot_antigo_nao_muda(repositorio):
+    repositorio.salvar("t", {'pos_x': 1})
+    antes = repositorio.snapshot()
+    repositorio.salvar("t", {'pos_x': 2})
+    assert antes["t"] == {'pos_x': 1}
+
+# --- Migração ---
+def test_migracao(tmp_path):
+    legado = tmp_path / "templates.json"
+    conteudo = {"Capa (A4)": {'pos_x': 1}, "../x": {'pos_x': 2}, "zz": {'pos_x': 3}, "quebrado": "não é config"}
+    legado.write_text(json.dumps(conteudo), encoding='utf-8')
+    pasta = tmp_path / "templates"
+
+    assert migrar_templates_json(legado, pasta) == 3
+    repositorio = RepositorioTemplates(pasta=pasta, legado=legado)
+    assert dict(repositorio.snapshot()) == {"../x": {'pos_x': 2}, "Capa (A4)": {'pos_x': 1}, "zz": {'pos_x': 3}}
+    assert {repositorio.versao(t) for t in repositorio.snapshot()} == {1}
+    assert json.loads(legado.read_text(encoding='utf-8')) == conteudo # O arquivo antigo não é tocado
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["templates", "templates.json"]
+
+    assert migrar_templates_json(legado, pasta) == 0 # Já migrado
+
+def test_migracao_sem_legado(tmp_path):
+    assert migrar_templates_json(tmp_path / "templates.json", tmp_path / "templates") == 0
+    assert not (tmp_path / "templates").exists()
+
+def test_migracao_remove_restos_de_gravacao(tmp_path):
+    legado = tmp_path / "templates.json"
+    legado.write_text(json.dumps({"t": {'pos_x': 1}}), encoding='utf-8')
+    pasta = tmp_path / "templates"
+    pasta.mkdir()
+    (pasta / "t.json.lock").touch() # Gravação interrompida: trava e temporário ficaram para trás
+    (pasta / "t.json.1234abcd.tmp").write_text("{", encoding='utf-8')
+
+    assert migrar_templates_json(legado, pasta) == 1
+    assert sorted(p.name for p in pasta.iterdir()) == ["t.json"]
+
+def test_migracao_recusa_pasta_com_outros_arquivos(tmp_path):
+    legado = tmp_path / "templates.json"
+    legado.write_text(json.dumps({"t": {'pos_x': 1}}), encoding='utf-8')
+    pasta = tmp_path / "templates"
+    pasta.mkdir()
+    (pasta / "LEIA-ME.txt").touch()
+
+    with pytest.raises(FileExistsError, match="LEIA-ME.txt"):
+        migrar_templates_json(legado, pasta)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["templates", "templates.json"]
+
+def test_migracao_interrompida_nao_deixa_pasta_temporaria(tmp_path, monkeypatch):
+    legado = tmp_path / "templates.json"
+    legado.write_text(json.dumps({"a": {'pos_x': 1}, "b": {'pos_x': 2}}), encoding='utf-8')
+
+    def gravar_e_falhar(path, versao, config):
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(repositorio_templates, "_gravar_arquivo", gravar_e_falhar)
+    with pytest.raises(OSError, match="disco cheio"):
+        migrar_templates_json(legado, tmp_path / "templates")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["templates.json"]
@@ -0,0 +1,74 @@
+import pytest
+
+from validacao_pedidos import PICTURE_DIR, validar_pedido, validar_pedidos
+
+CATALOGO = {
+    'bases': {
+        'agenda.pdf': {'tipo': 'pdf', 'paginas': 2, 'dimensoes': [[595.0, 842.0], [595.0, 842.0]]},
+        'folha.pdf': {'tipo': 'pdf', 'paginas': 1, 'dimensoes': [[595.0, 842.0]]},
+        'capa.jpg': {'tipo': 'raster', 'paginas': 1, 'dimensoes': [[2480, 3508]], 'dpi': 300.0},
+        'verso_150.jpg': {'tipo': 'raster', 'paginas': 1, 'dimensoes': [[736, 920]], 'dpi': 150.0},
+    },
+    'fontes': {'sao.ttf': {}},
+}
+TEMPLATES = {
+    'frente': {'pos_x': 100, 'pos_y': 100, 'max_width_pixels': 1500, 'font_size': 60, 'font_name': 'sao.ttf'},
+    'estreito': {'pos_x': 100, 'pos_y': 100, 'max_width_pixels': 150, 'font_size': 60},
+    'uma_linha': {'pos_x': 100, 'pos_y': 100, 'max_width_pixels': 150, 'font_size': 60, 'max_lines': 1},
+    'fonte_texto': {'pos_x': 100, 'pos_y': 100, 'max_width_pixels': 1500, 'font_size': "60"}, # Editado à mão
+}
+
+def _pedido(saida="a.pdf", base="agenda.pdf", template="frente", texto="Maria", **extra) -> dict:
+    pedido = {'output_pdf': saida, 'input_pdf_base': base, 'pagina_frente': {'template_imagem': template, 'texto': texto}}
+    pedido.update(extra)
+    return pedido
+
+def test_pedido_valido():
+    resultado = validar_pedido(_pedido(), CATALOGO, TEMPLATES)
+    assert resultado['erros'] == [] and resultado['avisos'] == []
+    assert resultado['paginas'] == [(PICTURE_DIR / "agenda.pdf", 0), (PICTURE_DIR / "agenda.pdf", 1)]
+    assert resultado['pixels'] == 2 * 2479 * 3508
+
+@pytest.mark.parametrize("pedido, erro", [
+    ({'output_pdf': 'a.pdf'}, "JSON mal formatado"),
+    (_pedido(base="nada.pdf"), "Base de entrada 'nada.pdf' não encontrada"),
+    (_pedido(input_verso="nada.jpg"), "Verso 'nada.jpg' não encontrado"),
+    (_pedido(base="folha.pdf"), "tem apenas 1 página(s)"),
+    (_pedido(template="nao_existe"), "Template 'nao_existe' não definido"),
+    (_pedido(texto=None), "incompleta"),
+    (_pedido(texto=12345), "'texto' da frente deve ser uma string"),
+    (_pedido(pagina_frente={'template_imagem': 'frente', 'texto': 'x', 'fonte': 'x.ttf'}), "Fonte 'x.ttf' não encontrada"),
+])
+def test_erros_de_referencia(pedido, erro):
+    erros = validar_pedido(pedido, CATALOGO, TEMPLATES)['erros']
+    assert len(erros) == 1 and erro in erros[0]
+
+def test_imagem_sem_verso_gera_so_a_frente():
+    resultado = validar_pedido(_pedido(base="capa.jpg"), CATALOGO, TEMPLATES)
+    assert resultado['paginas'] == [(PICTURE_DIR / "capa.jpg", 0)]
+
+def test_avisos_de_layout():
+    avisos = validar_pedido(_pedido(template="uma_linha", texto="Maria Aparecida Santos"), CATALOGO, TEMPLATES)['avisos']
+    assert any("max_lines=1" in aviso for aviso in avisos)
+    avisos = validar_pedido(_pedido(template="estreito", texto="Anticonstitucionalissimamente"), CATALOGO, TEMPLATES)['avisos']
+    assert any("mais larga que max_width_pixels=150" in aviso for aviso in avisos)
+
+def test_aviso_de_verso_com_outro_tamanho():
+    avisos = validar_pedido(_pedido(base="capa.jpg", input_verso="verso_150.jpg"), CATALOGO, TEMPLATES)['avisos']
+    assert len(avisos) == 1 and "tamanhos físicos diferentes" in avisos[0]
+
+def test_erro_inesperado_invalida_so_o_pedido():
+    pedidos = [_pedido("a.pdf"), _pedido("b.pdf", template="fonte_texto"), "não é um pedido", _pedido("c.pdf", texto="Ana")]
+    validos, relatorio = validar_pedidos(pedidos, CATALOGO, TEMPLATES)
+    assert [i for i, _, _ in validos] == [0, 3]
+    assert relatorio['invalidos'] == 2
+    assert "TypeError" in relatorio['pedidos'][1]['erros'][0]
+    assert relatorio['pedidos'][2]['output_pdf'] is None and relatorio['pedidos'][2]['erros']
+
+def test_custo_considera_duplicados_e_cache():
+    pedidos = [_pedido("a.pdf"), _pedido("b.pdf"), _pedido("c.pdf", texto="Ana")]
+    validos, relatorio = validar_pedidos(pedidos, CATALOGO, TEMPLATES)
+    custo = relatorio['custo_estimado']
+    assert len(validos) == 3
+    assert custo['renderizacoes'] == 2 and custo['reaproveitados'] == 1
+    assert custo['paginas_base_decodificadas'] == 2 # As duas páginas de agenda.pdf, decodificadas uma vez
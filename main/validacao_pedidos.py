@@ -0,0 +1,208 @@
+import logging
+from pathlib import Path
+from catalogo_assets import info_base, tamanho_pagina_pixels, tamanho_pagina_pontos
+from carregador_bases import BYTES_POR_PIXEL, eh_raster
+from desenho_texto import GLOBAL_DEFAULT_FONT, carregar_fonte, layout_templated_text, medir_linha, quebrar_linhas
+
+# --- Configuração de Logging ---
+logger = logging.getLogger(__name__)
+
+# --- Definição de Caminhos ---
+BASE_DIR = Path(__file__).parent
+PICTURE_DIR = BASE_DIR / "pictures"
+
+TOLERANCIA_TAMANHO = 0.01 # Diferença relativa aceita entre o tamanho físico da frente e do verso
+
+def paginas_do_pedido(pedido: dict, catalogo: dict) -> list[tuple[Path, int]]:
+    """
+    Decide de onde vem cada página do pedido: [(arquivo, página), ...].
+    A frente é sempre a primeira página de 'input_pdf_base'. O verso vem de
+    'input_verso' (imagem ou PDF separado), se informado; senão, da segunda
+    página do PDF base. Bases em imagem sem 'input_verso' geram só a frente.
+    """
+    base_name = pedido['input_pdf_base']
+    info = info_base(catalogo, base_name)
+    if not info:
+        raise FileNotFoundError(f"Base de entrada '{base_name}' não encontrada em '{PICTURE_DIR}'.")
+    paginas = [(PICTURE_DIR / base_name, 0)]
+
+    verso_name = pedido.get('input_verso')
+    if verso_name:
+        if not info_base(catalogo, verso_name):
+            raise FileNotFoundError(f"Verso '{verso_name}' não encontrado em '{PICTURE_DIR}'.")
+        paginas.append((PICTURE_DIR / verso_name, 0))
+    elif not eh_raster(base_name):
+        if info['paginas'] < 2:
+            raise IndexError(f"PDF de entrada '{base_name}' tem apenas {info['paginas']} página(s); são necessárias 2.")
+        paginas.append((PICTURE_DIR / base_name, 1))
+    return paginas
+
+def _pixels_pagina(catalogo: dict, nome: str, page_number: int, dpi: int) -> int:
+    largura, altura = tamanho_pagina_pixels(info_base(catalogo, nome), page_number, dpi)
+    return largura * altura
+
+def _comparar_tamanhos(catalogo: dict, paginas: list[tuple[Path, int]]) -> str | None:
+    """Aviso se o verso tiver outro tamanho físico que a frente (ex.: imagem com outro DPI)."""
+    (frente, n_frente), (verso, n_verso) = paginas[0], paginas[1]
+    lf, af = tamanho_pagina_pontos(info_base(catalogo, frente.name), n_frente)
+    lv, av = tamanho_pagina_pontos(info_base(catalogo, verso.name), n_verso)
+    if abs(lf - lv) > TOLERANCIA_TAMANHO * lf or abs(af - av) > TOLERANCIA_TAMANHO * af:
+        return (f"Frente ({lf:.0f}x{af:.0f} pt) e verso ({lv:.0f}x{av:.0f} pt) têm tamanhos físicos diferentes; "
+                f"o verso sai no seu próprio tamanho, não no da frente.")
+    return None
+
+def chave_pedido(pedido: dict) -> tuple | None:
+    """Dois pedidos com a mesma chave geram exatamente o mesmo PDF."""
+    frente = pedido.get('pagina_frente') or {}
+    if not pedido.get('input_pdf_base') or not frente.get('template_imagem'):
+        return None
+    return (pedido['input_pdf_base'], pedido.get('input_verso'), frente['template_imagem'], frente.get('texto'), frente.get('fonte'))
+
+def _fonte_do_pedido(config: dict, fonte_override: str | None, catalogo: dict) -> str:
+    """Mesma regra de resolver_nome_fonte, mas uma fonte ausente é erro (sem fallback silencioso)."""
+    font_name = fonte_override or config.get('font_name') or GLOBAL_DEFAULT_FONT
+    if font_name not in catalogo['fontes']:
+        raise FileNotFoundError(f"Fonte '{font_name}' não encontrada na pasta de fontes.")
+    return font_name
+
+def _medir_texto(config: dict, texto: str, font_name: str, tamanho_pagina: tuple[int, int]) -> list[str]:
+    """Roda só a medição do texto (sem desenhar) e devolve os avisos de layout."""
+    avisos = []
+    font = carregar_fonte(font_name, config.get('font_size', 50))
+    max_pixel_width = config.get('max_width_pixels', 9999)
+
+    linhas = quebrar_linhas(config, texto, font)
+    max_lines = config.get('max_lines')
+    if max_lines is not None and len(linhas) > max_lines:
+        cortado = " ".join(linhas[max_lines:])
+        avisos.append(f"Texto excede max_lines={max_lines} ({len(linhas)} linhas). Trecho cortado: '{cortado}'.")
+
+    for x, _, linha in layout_templated_text(config, texto, font):
+        largura, _ = medir_linha(linha, font)
+        if largura > max_pixel_width:
+            avisos.append(f"Linha '{linha}' ({largura:.0f}px) é mais larga que max_width_pixels={max_pixel_width}.")
+        if x < 0 or x + largura > tamanho_pagina[0]:
+            avisos.append(f"Linha '{linha}' sai da largura da página ({tamanho_pagina[0]}px).")
+    return avisos
+
+def validar_pedido(pedido: dict, catalogo: dict, templates: dict, dpi: int = 300) -> dict:
+    """
+    Valida um pedido sem rasterizar nada: referências (base, verso, template, fonte)
+    e medição do texto. Retorna um dict com 'erros', 'avisos', 'paginas' e 'pixels'.
+    """
+    resultado = {'output_pdf': pedido.get('output_pdf'), 'erros': [], 'avisos': [], 'paginas': [], 'pixels': 0}
+    frente = pedido.get('pagina_frente')
+
+    if not pedido.get('output_pdf') or not pedido.get('input_pdf_base') or not frente:
+        resultado['erros'].append("JSON mal formatado: 'output_pdf', 'input_pdf_base' ou 'pagina_frente' faltando.")
+        return resultado
+
+    try:
+        resultado['paginas'] = paginas_do_pedido(pedido, catalogo)
+    except Exception as e:
+        resultado['erros'].append(str(e))
+
+    for path, page_number in resultado['paginas']:
+        resultado['pixels'] += _pixels_pagina(catalogo, path.name, page_number, dpi)
+    if len(resultado['paginas']) > 1:
+        aviso = _comparar_tamanhos(catalogo, resultado['paginas'])
+        if aviso:
+            resultado['avisos'].append(aviso)
+
+    template_name = frente.get('template_imagem')
+    texto = frente.get('texto')
+    if not template_name or texto is None:
+        resultado['erros'].append("Configuração de página da frente incompleta ('template_imagem' ou 'texto').")
+        return resultado
+    if not isinstance(texto, str):
+        resultado['erros'].append(f"'texto' da frente deve ser uma string (recebido: {type(texto).__name__}).")
+        return resultado
+    if template_name not in templates:
+        resultado['erros'].append(f"Template '{template_name}' não definido no repositório de templates.")
+        return resultado
+
+    config = templates[template_name]
+    try:
+        font_name = _fonte_do_pedido(config, frente.get('fonte'), catalogo)
+    except FileNotFoundError as e:
+        resultado['erros'].append(str(e))
+        return resultado
+
+    if resultado['paginas']:
+        info = info_base(catalogo, resultado['paginas'][0][0].name)
+        tamanho_frente = tamanho_pagina_pixels(info, 0, dpi)
+        resultado['avisos'].extend(_medir_texto(config, texto, font_name, tamanho_frente))
+    return resultado
+
+def validar_pedidos(pedidos: list[dict], catalogo: dict, templates: dict, dpi: int = 300) -> tuple[list[tuple[int, dict, list]], dict]:
+    """
+    Pré-passo de validação do lote. Retorna (válidos, relatório):
+    - válidos: [(índice, pedido, páginas), ...] prontos para o motor de renderização;
+    - relatório: resultado por pedido e uma estimativa de custo do lote.
+    A estimativa considera o cache de páginas (cada página de base é decodificada
+    uma vez) e a deduplicação (pedidos idênticos não são codificados de novo).
+    """
+    validos = []
+    por_pedido = []
+    paginas_unicas = {}
+    pedidos_unicos = set()
+    pixels_codificados = 0
+
+    for i, pedido in enumerate(pedidos):
+        try:
+            resultado = validar_pedido(pedido, catalogo, templates, dpi)
+        except Exception as e:
+            # Um pedido (ou template) malformado invalida só ele, nunca o lote inteiro
+            logger.debug(f"Erro ao validar o pedido {i + 1}", exc_info=True)
+            resultado = {'output_pdf': pedido.get('output_pdf') if isinstance(pedido, dict) else None,
+                         'erros': [f"Erro ao validar o pedido ({type(e).__name__}: {e})."], 'avisos': []}
+        por_pedido.append({
+            'indice': i + 1,
+            'output_pdf': resultado['output_pdf'],
+            'erros': resultado['erros'],
+            'avisos': resultado['avisos'],
+        })
+        if resultado['erros']:
+            continue
+
+        validos.append((i, pedido, resultado['paginas']))
+        for path, page_number in resultado['paginas']:
+            paginas_unicas[(path.name, page_number)] = _pixels_pagina(catalogo, path.name, page_number, dpi)
+
+        chave = chave_pedido(pedido)
+        if chave not in pedidos_unicos:
+            pedidos_unicos.add(chave)
+            pixels_codificados += resultado['pixels']
+
+    pixels_decodificados = sum(paginas_unicas.values())
+    relatorio = {
+        'total': len(pedidos),
+        'validos': len(validos),
+        'invalidos': len(pedidos) - len(validos),
+        'com_avisos': sum(1 for r in por_pedido if r['avisos'] and not r['erros']),
+        'pedidos': por_pedido,
+        'custo_estimado': {
+            'renderizacoes': len(pedidos_unicos),
+            'reaproveitados': len(validos) - len(pedidos_unicos),
+            'paginas_base_decodificadas': len(paginas_unicas),
+            'megapixels_decodificados': round(pixels_decodificados / 1e6, 1),
+            'megapixels_codificados': round(pixels_codificados / 1e6, 1),
+            'maior_pagina_mb': round(max(paginas_unicas.values(), default=0) * BYTES_POR_PIXEL / 2**20, 1),
+        },
+    }
+    return validos, relatorio
+
+def registrar_relatorio(relatorio: dict):
+    """Escreve o relatório do pré-passo no log."""
+    for r in relatorio['pedidos']:
+        for erro in r['erros']:
+            logger.error(f"  -> Pedido {r['indice']} ('{r['output_pdf']}') INVÁLIDO: {erro}")
+        for aviso in r['avisos']:
+            logger.warning(f"  -> Pedido {r['indice']} ('{r['output_pdf']}'): {aviso}")
+
+    custo = relatorio['custo_estimado']
+    logger.info(f"Validação: {relatorio['validos']}/{relatorio['total']} pedidos válidos, "
+                f"{relatorio['com_avisos']} com avisos de layout, {relatorio['invalidos']} inválidos.")
+    logger.info(f"Custo estimado: {custo['renderizacoes']} renderizações ({custo['reaproveitados']} reaproveitadas), "
+                f"{custo['paginas_base_decodificadas']} páginas de base ({custo['megapixels_decodificados']} MP), "
+                f"{custo['megapixels_codificados']} MP a codificar; maior página ~{custo['maior_pagina_mb']} MB.")